@@ -0,0 +1,85 @@
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import List
+
+from sqlalchemy import delete, insert, select
+
+from . import models
+from .database import get_engine
+
+logger = logging.getLogger(__name__)
+
+CLOSED_STATUSES = ("Выполнено", "Отклонено")
+ARCHIVE_AFTER_DAYS = int(os.environ.get("ARCHIVE_AFTER_DAYS", "180"))
+
+_APPEAL_COLUMNS = (
+    "id", "user_id", "category_id", "status_id", "assignee_id", "address", "description",
+    "created_at", "updated_at", "file_paths", "file_size", "file_type",
+)
+_MESSAGE_COLUMNS = (
+    "id", "appeal_id", "sender_id", "content", "created_at", "file_paths", "file_size", "file_type",
+)
+
+
+def _closed_before(cutoff: datetime):
+    closed_statuses = select(models.AppealStatus.id).where(models.AppealStatus.name.in_(CLOSED_STATUSES))
+    return (
+        models.Appeal.status_id.in_(closed_statuses),
+        models.Appeal.updated_at < cutoff,
+    )
+
+
+def _archive_batch(connection, ids: List[int], cutoff: datetime) -> int:
+    # Re-check the condition under a row lock: an appeal reopened since the
+    # candidate scan must stay, and rows locked by a running request are
+    # left for the next run.
+    locked = connection.execute(
+        select(models.Appeal.id)
+        .where(models.Appeal.id.in_(ids), *_closed_before(cutoff))
+        .with_for_update(skip_locked=True)
+    ).scalars().all()
+    if not locked:
+        return 0
+
+    appeals, archived_appeals = models.Appeal.__table__, models.ArchivedAppeal.__table__
+    messages, archived_messages = models.Message.__table__, models.ArchivedMessage.__table__
+    connection.execute(insert(archived_appeals).from_select(
+        _APPEAL_COLUMNS,
+        select(*[appeals.c[name] for name in _APPEAL_COLUMNS]).where(appeals.c.id.in_(locked)),
+    ))
+    connection.execute(insert(archived_messages).from_select(
+        _MESSAGE_COLUMNS,
+        select(*[messages.c[name] for name in _MESSAGE_COLUMNS]).where(messages.c.appeal_id.in_(locked)),
+    ))
+    tombstones = models.AppealTombstone.__table__
+    connection.execute(insert(tombstones).from_select(
+        ("appeal_id", "user_id"),
+        select(appeals.c.id, appeals.c.user_id).where(appeals.c.id.in_(locked)),
+    ))
+    read_states = models.AppealReadState.__table__
+    connection.execute(delete(read_states).where(read_states.c.appeal_id.in_(locked)))
+    connection.execute(delete(messages).where(messages.c.appeal_id.in_(locked)))
+    connection.execute(delete(appeals).where(appeals.c.id.in_(locked)))
+    return len(locked)
+
+
+def archive_closed_appeals(older_than_days: int = ARCHIVE_AFTER_DAYS, batch_size: int = 500) -> int:
+    """Move closed appeals untouched for `older_than_days` into the archive tables.
+
+    Every batch is its own transaction, so the job can be interrupted and
+    rerun at any point.
+    """
+    cutoff = datetime.now() - timedelta(days=older_than_days)
+    engine = get_engine()
+    with engine.connect() as connection:
+        candidates = connection.execute(
+            select(models.Appeal.id).where(*_closed_before(cutoff)).order_by(models.Appeal.id)
+        ).scalars().all()
+
+    archived = 0
+    for start in range(0, len(candidates), batch_size):
+        with engine.begin() as connection:
+            archived += _archive_batch(connection, candidates[start:start + batch_size], cutoff)
+        logger.info("Archived %d of %d candidate appeals", archived, len(candidates))
+    return archived
@@ -0,0 +1,96 @@
+import os
+from typing import List, Optional
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from . import models, unread
+from .archive import CLOSED_STATUSES
+
+# off: appeals wait in the queue until an inspector claims one.
+# round_robin: active inspectors take turns in id order.
+# least_loaded: the inspector with the fewest open assigned appeals.
+AUTO_ASSIGN_STRATEGIES = ("off", "round_robin", "least_loaded")
+AUTO_ASSIGN = os.environ.get("APPEAL_AUTO_ASSIGN", "off")
+if AUTO_ASSIGN not in AUTO_ASSIGN_STRATEGIES:
+    raise ValueError(f"APPEAL_AUTO_ASSIGN must be one of {', '.join(AUTO_ASSIGN_STRATEGIES)}, got {AUTO_ASSIGN!r}")
+
+
+def _open_status_filter(status_column):
+    closed = select(models.AppealStatus.id).where(models.AppealStatus.name.in_(CLOSED_STATUSES))
+    return status_column.not_in(closed)
+
+
+def _active_inspectors(db: Session):
+    return db.query(models.User.id).filter(models.User.role == "inspector", models.User.is_active == True)
+
+
+def pick_assignee(db: Session, strategy: Optional[str] = None) -> Optional[int]:
+    strategy = strategy or AUTO_ASSIGN
+    if strategy == "round_robin":
+        # The latest assignment is the shared "whose turn" state, so several
+        # workers agree on the next inspector without extra bookkeeping.
+        last = (
+            db.query(models.Appeal.assignee_id)
+            .filter(models.Appeal.assignee_id.isnot(None))
+            .order_by(models.Appeal.id.desc())
+            .limit(1)
+            .scalar()
+        )
+        inspectors = _active_inspectors(db).order_by(models.User.id)
+        if last is not None:
+            following = inspectors.filter(models.User.id > last).limit(1).scalar()
+            if following is not None:
+                return following
+        return inspectors.limit(1).scalar()
+    if strategy == "least_loaded":
+        load = func.count(models.Appeal.id)
+        return (
+            _active_inspectors(db)
+            .outerjoin(models.Appeal, (models.Appeal.assignee_id == models.User.id) & _open_status_filter(models.Appeal.status_id))
+            .group_by(models.User.id)
+            .order_by(load, models.User.id)
+            .limit(1)
+            .scalar()
+        )
+    return None
+
+
+def claim_next(db: Session, inspector_id: int) -> Optional[models.Appeal]:
+    """Assign the oldest unassigned open appeal to the inspector.
+
+    SKIP LOCKED lets concurrent claims pass over each other's candidate rows
+    instead of queueing on them, so two inspectors never get the same appeal.
+    """
+    appeal = (
+        db.query(models.Appeal)
+        .filter(
+            models.Appeal.assignee_id.is_(None),
+            _open_status_filter(models.Appeal.status_id),
+        )
+        .order_by(models.Appeal.created_at, models.Appeal.id)
+        .with_for_update(skip_locked=True)
+        .first()
+    )
+    if appeal is not None:
+        appeal.assignee_id = inspector_id
+        unread.track_assignee(db, appeal.id, inspector_id)
+    return appeal
+
+
+def release_assignments(db: Session, inspector_id: int) -> int:
+    """Put the inspector's open appeals back in the queue, e.g. when the account is deactivated."""
+    return (
+        db.query(models.Appeal)
+        .filter(models.Appeal.assignee_id == inspector_id, _open_status_filter(models.Appeal.status_id))
+        .update({models.Appeal.assignee_id: None}, synchronize_session=False)
+    )
+
+
+def inspector_recipients(db: Session, appeal: models.Appeal) -> List[int]:
+    """Inspectors to notify about an appeal: its assignee, or every active inspector
+    while it is unassigned or the assignee can no longer act on it."""
+    if appeal.assignee_id is not None:
+        if _active_inspectors(db).filter(models.User.id == appeal.assignee_id).first() is not None:
+            return [appeal.assignee_id]
+    return [inspector_id for inspector_id, in _active_inspectors(db)]
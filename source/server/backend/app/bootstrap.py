@@ -0,0 +1,89 @@
+import asyncio
+import hashlib
+import os
+from typing import Callable, Dict, Optional
+
+import orjson
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.orm import sessionmaker
+
+from . import models, serializers
+
+# GET /bootstrap bundles what the app loads on launch. The sections are
+# computed in three sessions on worker threads (the small reference lists
+# share one), so the queries run concurrently; each section gets an ETag the
+# client can send back in If-None-Match to have it left out while unchanged.
+#
+# A load therefore holds up to three pooled connections and three threadpool
+# slots. BOOTSTRAP_CONCURRENCY caps the loads running at once in a process, so
+# bootstrap uses at most 3 * BOOTSTRAP_CONCURRENCY connections: keep that well
+# below the engine's pool_size + max_overflow (5 + 10 by default) so that a
+# wave of app launches cannot starve the other endpoints. Loads over the cap
+# wait for a slot.
+
+SECTIONS = ("user", "appeal_statuses", "appeal_categories", "appeals", "device")
+BOOTSTRAP_CONCURRENCY = int(os.environ.get("BOOTSTRAP_CONCURRENCY", "2"))
+
+_load_slots = asyncio.Semaphore(BOOTSTRAP_CONCURRENCY)
+
+
+def section_etag(name: str, data) -> str:
+    digest = hashlib.sha256(orjson.dumps(data)).hexdigest()[:16]
+    return f'W/"{name}-{digest}"'
+
+
+def parse_if_none_match(header: Optional[str]) -> set:
+    if not header:
+        return set()
+    return {tag.strip() for tag in header.split(",") if tag.strip()}
+
+
+def _appeal_statuses(db) -> list:
+    return [{"id": s.id, "name": s.name} for s in db.query(models.AppealStatus).order_by(models.AppealStatus.id)]
+
+
+def _appeal_categories(db) -> list:
+    return [{"id": c.id, "name": c.name} for c in db.query(models.AppealCategory).order_by(models.AppealCategory.id)]
+
+
+def _reference_data(db) -> tuple:
+    return _appeal_statuses(db), _appeal_categories(db)
+
+
+def _appeals(db, user_id: int, role: str, limit: int, load_options) -> list:
+    query = db.query(models.Appeal).options(*load_options)
+    if role != "inspector":
+        query = query.filter(models.Appeal.user_id == user_id)
+    appeals = query.order_by(models.Appeal.created_at.desc(), models.Appeal.id.desc()).limit(limit).all()
+    return serializers.appeals_to_list(appeals)
+
+
+def _device(db, user_id: int, fcm_token: Optional[str]) -> dict:
+    tokens = [row.fcm_token for row in db.query(models.DeviceToken.fcm_token).filter(models.DeviceToken.user_id == user_id)]
+    return {
+        "device_count": len(tokens),
+        "registered": fcm_token in tokens if fcm_token else None,
+    }
+
+
+def _in_session(factory: sessionmaker, section: Callable, *args):
+    with factory() as db:
+        return section(db, *args)
+
+
+async def load(factory: sessionmaker, user: dict, appeals_limit: int, appeal_load_options,
+               fcm_token: Optional[str]) -> Dict[str, object]:
+    """All sections of the bootstrap response, keyed by name."""
+    async with _load_slots:
+        (statuses, categories), appeals, device = await asyncio.gather(
+            run_in_threadpool(_in_session, factory, _reference_data),
+            run_in_threadpool(_in_session, factory, _appeals, user["id"], user["role"], appeals_limit, appeal_load_options),
+            run_in_threadpool(_in_session, factory, _device, user["id"], fcm_token),
+        )
+    return {
+        "user": user,
+        "appeal_statuses": statuses,
+        "appeal_categories": categories,
+        "appeals": appeals,
+        "device": device,
+    }
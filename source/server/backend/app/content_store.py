@@ -0,0 +1,84 @@
+import hashlib
+import os
+from typing import List, NamedTuple, Tuple
+
+from sqlalchemy import select, text
+from sqlalchemy.orm import Session
+
+from . import metrics, models
+from .storage import Storage
+
+# Attachments are stored once per distinct content under objects/<sha256><ext>;
+# stored_objects counts how many appeals and messages link to each of them.
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+_link_sql = text("""
+    INSERT INTO stored_objects (sha256, key, size, ref_count)
+    VALUES (:sha256, :key, :size, 1)
+    ON CONFLICT (sha256) DO UPDATE SET ref_count = stored_objects.ref_count + 1
+    RETURNING key
+""")
+
+
+class StoredFile(NamedTuple):
+    sha256: str
+    size: int
+    key: str
+
+
+def content_hash(fileobj) -> Tuple[str, int]:
+    """SHA-256 hex digest and size of a seekable file, read in chunks."""
+    digest = hashlib.sha256()
+    size = 0
+    fileobj.seek(0)
+    for chunk in iter(lambda: fileobj.read(HASH_CHUNK_SIZE), b""):
+        digest.update(chunk)
+        size += len(chunk)
+    fileobj.seek(0)
+    return digest.hexdigest(), size
+
+
+def upload_digests(files) -> List[Tuple[str, str, int]]:
+    """(filename, sha256, size) of each UploadFile, for idempotency fingerprints."""
+    return [(file.filename, *content_hash(file.file)) for file in files]
+
+
+def store_files(db: Session, storage: Storage, files, endpoint: str) -> List[StoredFile]:
+    """Upload the (fileobj, filename) pairs whose content is not stored yet.
+
+    Meant to run outside the request's transaction: the lookup borrows a pooled
+    connection only for one query, and no connection is held during uploads.
+    References are taken later by link().
+    """
+    hashed = [(content_hash(fileobj), fileobj, filename) for fileobj, filename in files]
+    if not hashed:
+        return []
+    hashes = {sha256 for (sha256, _), _, _ in hashed}
+    with db.get_bind().connect() as connection:
+        existing = dict(connection.execute(
+            select(models.StoredObject.sha256, models.StoredObject.key)
+            .where(models.StoredObject.sha256.in_(hashes))
+        ).all())
+
+    stored = []
+    for (sha256, size), fileobj, filename in hashed:
+        key = existing.get(sha256)
+        if key is not None:
+            metrics.STORAGE_DEDUP_HITS.labels(endpoint).inc()
+            metrics.STORAGE_DEDUP_BYTES.labels(endpoint).inc(size)
+        else:
+            # Two requests racing on new content upload the same bytes to the
+            # same key, and link() counts both references.
+            key = existing[sha256] = f"objects/{sha256}{os.path.splitext(filename)[1].lower()}"
+            storage.save(fileobj, key, endpoint)
+        stored.append(StoredFile(sha256, size, key))
+    return stored
+
+
+def link(db: Session, stored: List[StoredFile]) -> List[str]:
+    """Take a reference on each stored file in the caller's transaction; returns the keys."""
+    return [
+        db.execute(_link_sql, {"sha256": item.sha256, "key": item.key, "size": item.size}).scalar()
+        for item in stored
+    ]
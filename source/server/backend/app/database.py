@@ -0,0 +1,142 @@
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+from fastapi import Request
+from jose import JWTError, jwt
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.orm import sessionmaker
+
+from . import metrics, profiling
+
+SessionLocal = sessionmaker(autocommit=False, autoflush=False)
+ReplicaSessionLocal = sessionmaker(autocommit=False, autoflush=False)
+
+# After a user commits on the primary, their reads stay on the primary for this
+# long so they never see a replica that has not caught up with their own write.
+PRIMARY_PIN_SECONDS = float(os.environ.get("PRIMARY_PIN_SECONDS", "5"))
+
+_engine = None
+_replica_engine = None
+_engine_lock = threading.Lock()
+
+
+def _create_engine(url: str):
+    engine = create_engine(url, pool_pre_ping=True)
+    metrics.instrument_engine(engine)
+    if profiling.ENABLED:
+        profiling.instrument_engine(engine)
+    return engine
+
+
+def get_engine():
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = _create_engine(os.environ.get("DATABASE_URL"))
+                SessionLocal.configure(bind=_engine)
+    return _engine
+
+
+def get_replica_engine():
+    """Engine for DATABASE_REPLICA_URL, or None when no replica is configured."""
+    global _replica_engine
+    url = os.environ.get("DATABASE_REPLICA_URL")
+    if not url:
+        return None
+    if _replica_engine is None:
+        with _engine_lock:
+            if _replica_engine is None:
+                _replica_engine = _create_engine(url)
+                ReplicaSessionLocal.configure(bind=_replica_engine)
+    return _replica_engine
+
+
+def dispose_engines():
+    for engine in (_engine, _replica_engine):
+        if engine is not None:
+            engine.dispose()
+
+
+class PrimaryPins:
+    """User ids that recently wrote, with the monotonic time their pin expires.
+
+    Pins are per process; with several workers behind a balancer, use sticky
+    sessions or keep PRIMARY_PIN_SECONDS above the worst replica lag.
+    """
+
+    def __init__(self, max_keys: int = 10000):
+        self.max_keys = max_keys
+        self._pins: Dict[int, float] = {}
+
+    def pin(self, user_id: int, seconds: float):
+        now = time.monotonic()
+        if len(self._pins) >= self.max_keys:
+            for key in [key for key, until in self._pins.items() if until <= now]:
+                self._pins.pop(key, None)
+        self._pins[user_id] = now + seconds
+
+    def is_pinned(self, user_id: int) -> bool:
+        until = self._pins.get(user_id)
+        return until is not None and until > time.monotonic()
+
+
+primary_pins = PrimaryPins()
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _pin_writer(session):
+    # get_current_user records who owns the session; anonymous writes
+    # (registration, login) have nothing to pin.
+    user_id = session.info.get("user_id")
+    if user_id is not None and PRIMARY_PIN_SECONDS > 0:
+        primary_pins.pin(user_id, PRIMARY_PIN_SECONDS)
+
+
+def _token_user_id(request: Request) -> Optional[int]:
+    # Only used to choose a database; the token is verified by get_current_user.
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    try:
+        return jwt.get_unverified_claims(token).get("user_id")
+    except JWTError:
+        return None
+
+
+def get_db():
+    get_engine()
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def read_sessionmaker(user_id: Optional[int]) -> sessionmaker:
+    """The replica's sessionmaker, unless there is none or user_id wrote recently."""
+    get_engine()
+    if get_replica_engine() is None:
+        target, factory = "primary", SessionLocal
+    elif user_id is not None and primary_pins.is_pinned(user_id):
+        target, factory = "pinned", SessionLocal
+    else:
+        target, factory = "replica", ReplicaSessionLocal
+    metrics.READ_SESSIONS.labels(target).inc()
+    return factory
+
+
+def get_read_db(request: Request):
+    """Session for read-only endpoints: the replica, unless the caller wrote recently."""
+    db = read_sessionmaker(_token_user_id(request))()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def check_connection():
+    with get_engine().connect() as connection:
+        connection.execute(text("SELECT 1"))
@@ -0,0 +1,101 @@
+import os
+import re
+from typing import Optional, Tuple
+
+import anyio
+from starlette.responses import FileResponse
+from starlette.types import Receive, Scope, Send
+
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """Inclusive (start, end) of a single-range header, None to send the whole file.
+
+    Raises ValueError for a range that lies outside the file (416).
+    Multi-range requests are answered with the full file, which RFC 9110 allows.
+    """
+    match = _RANGE_RE.match((header or "").strip())
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the last N bytes.
+        length = int(last)
+        if length == 0:
+            raise ValueError("Empty suffix range")
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError("Range not satisfiable")
+    return start, end
+
+
+class RangeFileResponse(FileResponse):
+    """FileResponse that honours a single HTTP Range and If-Range.
+
+    When the server offers the ASGI zero-copy send extension, the file
+    descriptor is handed over for sendfile(); otherwise the file is streamed
+    in chunks like FileResponse does.
+    """
+
+    def __init__(self, path, range_header: Optional[str] = None, if_range: Optional[str] = None, **kwargs):
+        stat_result = kwargs.pop("stat_result", None) or os.stat(path)
+        super().__init__(path, stat_result=stat_result, **kwargs)
+        self.headers["accept-ranges"] = "bytes"
+        self.byte_range = None
+        if if_range and if_range not in (self.headers["etag"], self.headers["last-modified"]):
+            return
+        try:
+            self.byte_range = parse_range(range_header, stat_result.st_size)
+        except ValueError:
+            self.status_code = 416
+            self.headers["content-range"] = f"bytes */{stat_result.st_size}"
+            self.headers["content-length"] = "0"
+            self.send_header_only = True
+            return
+        if self.byte_range is not None:
+            start, end = self.byte_range
+            self.status_code = 206
+            self.headers["content-range"] = f"bytes {start}-{end}/{stat_result.st_size}"
+            self.headers["content-length"] = str(end - start + 1)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if self.byte_range is None and self.status_code == 200 and not self._zero_copy(scope):
+            await super().__call__(scope, receive, send)
+            return
+
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if self.send_header_only:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+        else:
+            start, end = self.byte_range or (0, self.stat_result.st_size - 1)
+            await self._send_range(scope, send, start, end - start + 1)
+        if self.background is not None:
+            await self.background()
+
+    @staticmethod
+    def _zero_copy(scope: Scope) -> bool:
+        return "http.response.zerocopysend" in scope.get("extensions", {})
+
+    async def _send_range(self, scope: Scope, send: Send, offset: int, count: int):
+        async with await anyio.open_file(self.path, mode="rb") as file:
+            if self._zero_copy(scope):
+                await send({
+                    "type": "http.response.zerocopysend", "file": file.wrapped.fileno(),
+                    "offset": offset, "count": count, "more_body": False,
+                })
+                return
+            await file.seek(offset)
+            remaining = count
+            while remaining > 0:
+                chunk = await file.read(min(self.chunk_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+            if remaining > 0:
+                await send({"type": "http.response.body", "body": b"", "more_body": False})
@@ -0,0 +1,97 @@
+import hashlib
+import os
+from datetime import datetime, timedelta
+from typing import Optional
+
+from fastapi import HTTPException, status
+from fastapi.responses import Response
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+IDEMPOTENCY_KEY_TTL = timedelta(hours=float(os.environ.get("IDEMPOTENCY_KEY_TTL_HOURS", "24")))
+REPLAY_HEADER = "Idempotent-Replayed"
+
+_claim_sql = text("""
+    INSERT INTO idempotency_keys (user_id, key, fingerprint, created_at, expires_at)
+    VALUES (:user_id, :key, :fingerprint, :now, :expires_at)
+    ON CONFLICT (user_id, key) DO NOTHING
+""")
+
+_lookup_sql = text("""
+    SELECT fingerprint, status_code, response_body, expires_at FROM idempotency_keys
+    WHERE user_id = :user_id AND key = :key
+""")
+
+
+def fingerprint(route: str, *parts) -> str:
+    """Hash of the route and the request fields that make a retry "the same request"."""
+    digest = hashlib.sha256(route.encode())
+    for part in parts:
+        digest.update(b"\x1f")
+        digest.update(repr(part).encode())
+    return digest.hexdigest()
+
+
+def begin(db: Session, user_id: int, key: str, request_fingerprint: str) -> Optional[Response]:
+    """Claim `key` for this request, or return the stored response of the request that owns it.
+
+    The claim is part of the request's transaction. A concurrent retry with the
+    same key blocks on the primary key until the first request commits, and then
+    replays its response; if the first request fails, the retry takes over.
+    """
+    now = datetime.utcnow()
+    params = {"user_id": user_id, "key": key}
+    db.execute(
+        text("DELETE FROM idempotency_keys WHERE user_id = :user_id AND key = :key AND expires_at < :now"),
+        {**params, "now": now},
+    )
+    claimed = db.execute(_claim_sql, {
+        **params, "fingerprint": request_fingerprint, "now": now, "expires_at": now + IDEMPOTENCY_KEY_TTL,
+    }).rowcount
+    if claimed:
+        return None
+
+    stored = db.execute(_lookup_sql, params).one()
+    if stored.fingerprint != request_fingerprint:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Idempotency-Key уже использован для другого запроса.",
+        )
+    if stored.status_code is None:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Запрос с этим Idempotency-Key еще обрабатывается.",
+        )
+    return Response(
+        content=stored.response_body,
+        status_code=stored.status_code,
+        media_type="application/json",
+        headers={REPLAY_HEADER: "true"},
+    )
+
+
+def complete(db: Session, user_id: int, key: str, response: Response):
+    """Store the response; call before the commit that persists the request's work."""
+    db.execute(
+        text("""
+            UPDATE idempotency_keys SET status_code = :status_code, response_body = :body
+            WHERE user_id = :user_id AND key = :key
+        """),
+        {"user_id": user_id, "key": key, "status_code": response.status_code, "body": bytes(response.body)},
+    )
+
+
+def release(db: Session, user_id: int, key: str):
+    """Drop an unfinished claim so that a retry with the same key runs the request again."""
+    db.execute(
+        text("DELETE FROM idempotency_keys WHERE user_id = :user_id AND key = :key AND status_code IS NULL"),
+        {"user_id": user_id, "key": key},
+    )
+
+
+def purge_expired(db: Session) -> int:
+    deleted = db.execute(
+        text("DELETE FROM idempotency_keys WHERE expires_at < :now"), {"now": datetime.utcnow()}
+    ).rowcount
+    db.commit()
+    return deleted
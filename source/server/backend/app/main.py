@@ -1,86 +1,74 @@
-import firebase_admin
-from firebase_admin import credentials, messaging
+import time
+_import_started = time.perf_counter()
+
 import os
-from fastapi import FastAPI, Depends, HTTPException, status, APIRouter, Query, UploadFile, File, Form
-from sqlalchemy import create_engine, text, desc, asc
-from sqlalchemy.orm import sessionmaker, Session, selectinload
+import stat
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Depends, HTTPException, status, APIRouter, Query, UploadFile, File, Form, Header, Request
+from sqlalchemy import text, desc, asc
+from sqlalchemy.orm import Session, selectinload, load_only
 from typing import List, Optional, Annotated
 from fastapi.middleware.cors import CORSMiddleware
-from . import models, schemas
+from fastapi.responses import ORJSONResponse, Response
+from fastapi.concurrency import run_in_threadpool
+from . import models, schemas, serializers, ratelimit, manage, metrics, profiling, unread, assignment, idempotency, uploads, content_store, pending, sync, bootstrap, user_import
 from .auth import get_password_hash, verify_password, create_access_token, decode_token
-from .models import Base, Message
+from .database import get_db, get_read_db, read_sessionmaker, get_engine, dispose_engines, check_connection
+from .notifications import send_fcm_notification, chat_notifications
+from .storage import Storage, LocalStorage, get_storage
+from .file_response import RangeFileResponse
+from .models import Message
 from .schemas import Message
 from jose import jwt, JWTError
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from datetime import timedelta, datetime
 import shutil
-import uuid
-import boto3
 from botocore.exceptions import ClientError
 from io import BytesIO
 import re
 import json
 import logging
+from .logging_config import configure_logging, stop_logging
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-FIREBASE_CREDENTIALS_PATH = os.environ.get("FIREBASE_CREDENTIALS_PATH")
-firebase_project_id = None
-
-if FIREBASE_CREDENTIALS_PATH and os.path.exists(FIREBASE_CREDENTIALS_PATH):
-    try:
-        with open(FIREBASE_CREDENTIALS_PATH, 'r') as f:
-           cred_data = json.load(f)
-           firebase_project_id = cred_data.get('project_id')
-           if not firebase_project_id:
-               print("WARNING: Could not find 'project_id' in Firebase credentials file.")
-
-        cred = credentials.Certificate(FIREBASE_CREDENTIALS_PATH)
-
-        if not firebase_admin._apps:
-            init_options = {'projectId': firebase_project_id} if firebase_project_id else None
-            firebase_admin.initialize_app(cred, init_options)
-            print(f"Firebase Admin SDK initialized successfully (Project ID: {firebase_project_id}).")
-        else:
-            current_app = firebase_admin.get_app()
-            if firebase_project_id and current_app.project_id != firebase_project_id:
-                 print(f"WARNING: Firebase Admin SDK already initialized with a different project ID ({current_app.project_id}). Expected: {firebase_project_id}")
-            else:
-                 print("Firebase Admin SDK already initialized.")
-
-    except Exception as e:
-        print(f"ERROR initializing Firebase Admin SDK: {e}")
-else:
-    print("WARNING: Firebase credentials path not set or file not found. Push notifications will not work.")
-    print(f"Firebase credentials path from env: {FIREBASE_CREDENTIALS_PATH}")
-    
 router = APIRouter()
 
-DATABASE_URL = os.environ.get("DATABASE_URL")
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-
-def get_db():
-    db = SessionLocal()
+RATE_LIMITS = ratelimit.parse_rate_limits(os.environ.get("RATE_LIMITS"))
+rate_limiter = ratelimit.create_rate_limiter(get_engine)
+upload_limiter = ratelimit.ConcurrencyLimiter(int(os.environ.get("UPLOAD_CONCURRENCY_LIMIT", "8")))
+UPLOAD_RETRY_AFTER = int(os.environ.get("UPLOAD_RETRY_AFTER", "5"))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Started here rather than on import, so that tools importing app.main
+    # (benchmarks, load tests) do not get a logging thread and new root handlers.
+    configure_logging()
+    # Schema and seed data are managed by `python -m app.manage init-db`;
+    # INIT_DB_ON_STARTUP=1 keeps the old behaviour for single-process development.
+    if os.environ.get("INIT_DB_ON_STARTUP") == "1":
+        await run_in_threadpool(manage.init_db)
     try:
-        yield db
-    finally:
-        db.close()
-
-def get_s3_client():
-    session = boto3.session.Session()
-    s3 = session.client(
-        service_name='s3',
-        endpoint_url=os.environ.get("YC_ENDPOINT_URL"),
-        aws_access_key_id=os.environ.get("YC_AWS_ACCESS_KEY_ID"),
-        aws_secret_access_key=os.environ.get("YC_AWS_SECRET_ACCESS_KEY"),
-    )
-    return s3
-
-app = FastAPI()
+        await run_in_threadpool(check_connection)
+    except Exception as e:
+        logger.error("Database is not reachable at startup: %s", e)
+    app.state.startup_seconds = time.perf_counter() - _import_started
+    app.state.ready = True
+    logger.info("Application ready in %.3fs after import", app.state.startup_seconds)
+    yield
+    app.state.ready = False
+    await chat_notifications.drain()
+    await run_in_threadpool(user_import.shutdown)
+    dispose_engines()
+    stop_logging()
+
+app = FastAPI(lifespan=lifespan)
+app.state.ready = False
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
+if profiling.ENABLED:
+    app.add_middleware(profiling.SQLProfilingMiddleware)
+app.add_middleware(metrics.MetricsMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -101,60 +89,54 @@ def test_db(db: Session = Depends(get_db)):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
+@app.get("/metrics", include_in_schema=False)
+def read_metrics():
+    content, content_type = metrics.render_latest()
+    return Response(content=content, media_type=content_type)
+
+@app.get("/health/live")
+def health_live():
+    return {"status": "alive"}
+
+@app.get("/health/ready")
+def health_ready(db: Session = Depends(get_db)):
+    if not app.state.ready:
+        raise HTTPException(status_code=503, detail="Starting up")
+    try:
+        db.execute(text("SELECT 1"))
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"Database unavailable: {e}")
+    return {"status": "ready", "startup_seconds": round(app.state.startup_seconds, 3)}
+
 def sanitize_filename(filename):
     return re.sub(r'[\\/*?:"<>|]', "", filename).replace(" ", "_")
 
-async def send_fcm_notification(user_id: int, title: str, body: str, data: Optional[dict] = None, db: Session = Depends(get_db)):
-    if not firebase_admin._apps:
-         print("Firebase Admin SDK not initialized. Cannot send notification.")
-         return
-
-    tokens = db.query(models.DeviceToken.fcm_token).filter(models.DeviceToken.user_id == user_id).all()
-    registration_tokens = [token for (token,) in tokens]
-
-    if not registration_tokens:
-        print(f"No FCM tokens found for user_id: {user_id}")
-        return
-
-    print(f"DEBUG: Sending notifications individually to tokens for user_id {user_id}: {registration_tokens}")
-
-    success_count = 0
-    failure_count = 0
-    failed_tokens = []
-
-    for token in registration_tokens:
-        message = messaging.Message(
-            notification=messaging.Notification(
-                title=title,
-                body=body,
-            ),
-            data=data if data else {},
-            token=token,
-        )
-        try:
-            response = messaging.send(message)
-            print(f"Successfully sent message to token {token[-10:]}: {response}")
-            success_count += 1
-        except messaging.UnregisteredError:
-             print(f"Token {token[-10:]} is unregistered. Consider removing from DB.")
-             failure_count += 1
-             failed_tokens.append(token)
-        except messaging.FirebaseError as e:
-             print(f"Firebase error sending to token {token[-10:]}: {e}")
-             failure_count += 1
-             failed_tokens.append(token)
-             if hasattr(e, 'http_response'):
-                  print(f"HTTP Response Body: {e.http_response.text}")
-        except Exception as e:
-             print(f"General error sending to token {token[-10:]}: {e}")
-             failure_count += 1
-             failed_tokens.append(token)
-
-    print(f"Finished sending notifications for user_id {user_id}. Success: {success_count}, Failures: {failure_count}")
-    if failure_count > 0:
-        print(f"Failed tokens: {[t[-10:] for t in failed_tokens]}")
-
-async def get_current_user(db: Session = Depends(get_db), token: str = Depends(oauth2_scheme)):
+def parse_list_param(value: Optional[str], allowed, default, param_name: str):
+    if value is None:
+        return default
+    items = tuple(dict.fromkeys(item.strip() for item in value.split(",") if item.strip()))
+    unknown = [item for item in items if item not in allowed]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown {param_name}: {', '.join(unknown)}")
+    return items
+
+def appeal_load_options(fields, include, appeal_model=models.Appeal, message_model=models.Message):
+    columns = set(fields) | {"user_id"}
+    for relation in ("user", "status", "category"):
+        if relation in include:
+            columns.add(f"{relation}_id")
+    options = [load_only(*[getattr(appeal_model, column) for column in columns])]
+    if "user" in include:
+        options.append(selectinload(appeal_model.user))
+    if "status" in include:
+        options.append(selectinload(appeal_model.status))
+    if "category" in include:
+        options.append(selectinload(appeal_model.category))
+    if "messages" in include:
+        options.append(selectinload(appeal_model.messages).selectinload(message_model.sender))
+    return options
+
+def authenticate(db: Session, token: str) -> models.User:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -176,46 +158,109 @@ async def get_current_user(db: Session = Depends(get_db), token: str = Depends(o
 
     return user
 
+async def get_current_user(db: Session = Depends(get_db), token: str = Depends(oauth2_scheme)):
+    user = authenticate(db, token)
+    # Commits on this session pin the user's reads to the primary (see database.get_read_db).
+    db.info["user_id"] = user.id
+    return user
+
 async def get_current_active_user(current_user: models.User = Depends(get_current_user)):
     if not current_user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
     return current_user
+
+# Read-only endpoints authenticate against the same (possibly replica) session
+# they query, so a GET never opens a connection to the primary.
+async def get_current_reader(db: Session = Depends(get_read_db), token: str = Depends(oauth2_scheme)):
+    return authenticate(db, token)
+
+async def get_current_active_reader(current_user: models.User = Depends(get_current_reader)):
+    if not current_user.is_active:
+        raise HTTPException(status_code=400, detail="Inactive user")
+    return current_user
+
+
+def rate_limited(route_name: str, user_dependency=get_current_active_user):
+    requests, period = RATE_LIMITS.get(route_name, (0, 1))
+
+    async def check_rate_limit(current_user: models.User = Depends(user_dependency)):
+        if requests <= 0:
+            return
+        key = f"{route_name}:{current_user.id}"
+        if rate_limiter.blocking:
+            retry_after = await run_in_threadpool(rate_limiter.hit, key, requests, period)
+        else:
+            retry_after = rate_limiter.hit(key, requests, period)
+        if retry_after > 0:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Слишком много запросов. Повторите попытку позже.",
+                headers=ratelimit.retry_after_header(retry_after),
+            )
+
+    return check_rate_limit
+
+async def upload_slot():
+    if not upload_limiter.try_acquire():
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Сервер перегружен загрузкой файлов. Повторите попытку позже.",
+            headers=ratelimit.retry_after_header(UPLOAD_RETRY_AFTER),
+        )
+    try:
+        yield
+    finally:
+        upload_limiter.release()
     
 
 @router.get("/knowledge_base/{category}", response_model=List[str])
-async def get_knowledge_base_category(category: str, s3_client = Depends(get_s3_client)):
+async def get_knowledge_base_category(category: str, storage: Storage = Depends(get_storage)):
     """
-    Получает список URL файлов в заданной категории (папке) в Object Storage.
+    Получает список URL файлов в заданной категории (папке) в хранилище.
     """
-    bucket_name = os.environ.get("YC_BUCKET_NAME")
     prefix = f"knowledge_base/{category}/"
 
     try:
-        objects = s3_client.list_objects_v2(Bucket=bucket_name, Prefix=prefix)
         file_urls = []
-
-        if 'Contents' in objects:
-            for obj in objects['Contents']:
+        for page in await run_in_threadpool(lambda: list(storage.list_pages(prefix))):
+            for obj in page:
                 file_key = obj['Key']
                 if not file_key.endswith('/'):
-                    file_url = f"https://storage.yandexcloud.net/{bucket_name}/{file_key}"
-                    file_urls.append(file_url)
+                    file_urls.append(storage.url(file_key))
 
         return file_urls
 
     except ClientError as e:
-        print(f"Error accessing Yandex Cloud Object Storage: {e}")
+        logger.error("Error accessing Yandex Cloud Object Storage: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
     except Exception as e:
-        print(f"Unexpected error: {e}")
+        logger.error("Unexpected error: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
-    except ClientError as e:
-        print(f"Error accessing Yandex Cloud Object Storage: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
-    except Exception as e:
-        print(f"Unexpected error: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+@router.api_route("/files/{key:path}", methods=["GET", "HEAD"], include_in_schema=False)
+def read_stored_file(
+    key: str,
+    request: Request,
+    storage: Storage = Depends(get_storage),
+):
+    # Attachments are public links, as with the public-read ACL on S3.
+    if not isinstance(storage, LocalStorage):
+        raise HTTPException(status_code=404, detail="Not found")
+    try:
+        path = storage.path(key)
+        stat_result = os.stat(path)
+    except (ValueError, FileNotFoundError, NotADirectoryError):
+        raise HTTPException(status_code=404, detail="Not found")
+    if not stat.S_ISREG(stat_result.st_mode):
+        raise HTTPException(status_code=404, detail="Not found")
+    return RangeFileResponse(
+        path,
+        range_header=request.headers.get("range"),
+        if_range=request.headers.get("if-range"),
+        stat_result=stat_result,
+        method=request.method,
+        headers={"Cache-Control": "public, max-age=31536000, immutable"} if key.startswith("objects/") else None,
+    )
 
 @router.post("/users/", response_model=schemas.User)
 def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
@@ -241,6 +286,23 @@ def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
     db.refresh(db_user)
     return db_user
 
+@router.post("/users/import")
+def import_users(
+    file: UploadFile = File(..., description="CSV with a header row, or NDJSON; fields: username, email, full_name, password, role"),
+    format: Optional[str] = Query(None, pattern="^(csv|ndjson)$", description="Overrides detection by file extension"),
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_active_user)
+):
+    if current_user.role != "inspector":
+        raise HTTPException(status_code=403, detail="Only inspectors can import users")
+
+    file_format = format or user_import.detect_format(file.filename, file.content_type)
+    report = user_import.import_users(db, user_import.read_file(file), file_format)
+    logger.info(
+        "User import by %s: %d created, %d rejected", current_user.id, len(report["created"]), len(report["errors"])
+    )
+    return ORJSONResponse(report)
+
 @router.get("/users/", response_model=List[schemas.User])
 def read_users(
     skip: int = 0,
@@ -248,8 +310,8 @@ def read_users(
     sort_by: str = "username",
     sort_order: str = "asc",
     is_active: bool = True,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_active_user)
+    db: Session = Depends(get_read_db),
+    current_user: models.User = Depends(get_current_active_reader)
 ):
     if current_user.role != "inspector":
         raise HTTPException(status_code=403, detail="Not authorized to view user list")
@@ -285,7 +347,7 @@ def read_users(
     return users
 
 @router.get("/users/{user_id}", response_model=schemas.User)
-def read_user(user_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_active_user)): # Исправлено
+def read_user(user_id: int, db: Session = Depends(get_read_db), current_user: models.User = Depends(get_current_active_reader)): # Исправлено
     if current_user.role != "inspector" and current_user.id != user_id:
         raise HTTPException(status_code=403, detail="Not authorized to view this user")
 
@@ -314,8 +376,13 @@ def update_user(user_id: int, user: schemas.UserUpdate, db: Session = Depends(ge
             raise HTTPException(status_code=400, detail="Пользователь с таким email уже существует")
 
 
+    was_active_inspector = db_user.role == "inspector" and db_user.is_active
     for var, value in user.model_dump(exclude_unset=False).items():
         setattr(db_user, var, value)
+    if was_active_inspector and not (db_user.role == "inspector" and db_user.is_active):
+        released = assignment.release_assignments(db, user_id)
+        if released:
+            logger.info("Returned %d open appeals of former inspector %s to the queue", released, user_id)
     db.commit()
     db.refresh(db_user)
     return db_user
@@ -340,21 +407,39 @@ def delete_user(user_id: int, db: Session = Depends(get_db), current_user: model
     if active_appeals_exist:
         raise HTTPException(status_code=400, detail="Cannot delete user: User has active appeals")
 
+    released = assignment.release_assignments(db, user_id)
+    if released:
+        logger.info("Returned %d open appeals of deactivated user %s to the queue", released, user_id)
     db_user.is_active = False
     db.commit()
 
     return {"message": "User deactivated"}
 
-@router.post("/appeals/", response_model=schemas.Appeal)
+@router.post(
+    "/appeals/",
+    response_model=schemas.Appeal,
+    dependencies=[Depends(rate_limited("create_appeal")), Depends(upload_slot)],
+)
 async def create_appeal(
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_active_user),
     address: str = Form(...),
     category_id: int = Form(...),
     description: Optional[str] = Form(None),
-    files: List[UploadFile] = File(...)
+    files: List[UploadFile] = File([]),
+    upload_ids: List[str] = Form([], description="Completed resumable uploads to attach instead of files"),
+    idempotency_key: Optional[str] = Header(None, max_length=255),
 ):
-    if not files or len(files) != 2:
+    if idempotency_key:
+        # Same names and sizes are not the same request: hash the contents (off the event loop).
+        file_digests = await run_in_threadpool(content_store.upload_digests, files)
+        request_fingerprint = idempotency.fingerprint("create_appeal", address, category_id, description, file_digests, upload_ids)
+        replay = idempotency.begin(db, current_user.id, idempotency_key, request_fingerprint)
+        if replay is not None:
+            return replay
+
+    attached_uploads = uploads.take_completed(db, current_user.id, upload_ids, attach=False)
+    if len(files) + len(attached_uploads) != 2:
          raise HTTPException(status_code=400, detail="Необходимо прикрепить ровно два файла: одно изображение и один PDF.")
 
     image_file = None
@@ -362,7 +447,7 @@ async def create_appeal(
     image_ext = {'.jpg', '.jpeg', '.png', '.gif', '.bmp'}
     pdf_ext = {'.pdf'}
 
-    for file in files:
+    for file in list(files) + attached_uploads:
         file_extension = os.path.splitext(file.filename)[1].lower()
         if file_extension in image_ext and image_file is None:
             image_file = file
@@ -374,86 +459,105 @@ async def create_appeal(
     if image_file is None or pdf_file is None:
          raise HTTPException(status_code=400, detail="Необходимо прикрепить одно изображение (JPG, PNG и т.д.) и один PDF файл.")
 
-
     default_status = db.query(models.AppealStatus).filter(models.AppealStatus.name == "Новое").first()
     if not default_status:
         raise HTTPException(status_code=500, detail="Статус по умолчанию 'Новое' не найден в базе данных.")
     status_id_default = default_status.id
 
-    db_appeal = models.Appeal(
-        address=address,
-        category_id=category_id,
-        description=description,
-        user_id=current_user.id,
-        status_id=status_id_default
-    )
-    db.add(db_appeal)
-    db.flush()
-
-    s3_client = get_s3_client()
-    bucket_name = os.environ.get("YC_BUCKET_NAME")
-    saved_file_paths = []
-
-    user_folder = sanitize_filename(current_user.username)
-    appeal_folder = f"{db_appeal.id}_{sanitize_filename(address)}/"
-    chat_folder = "chat"
-
     files_to_upload = [image_file, pdf_file]
-
-    for file in files_to_upload:
+    files_to_store = [file for file in files_to_upload if not isinstance(file, models.UploadSession)]
+    # Keys of resumable uploads in attachment order, None where a file still has to be stored.
+    upload_keys = [file.s3_key if isinstance(file, models.UploadSession) else None for file in files_to_upload]
+    user_id = current_user.id
+
+    storage = get_storage()
+    stored_files = []
+    pending_id = None
+    if files_to_store:
+        # No transaction or pooled connection stays open while the attachments
+        # travel to object storage; the appeal itself is inserted afterwards.
+        pending_id = pending.reserve(db, user_id, "create_appeal", idempotency_key)
+        db.commit()
         try:
-            file_ext = os.path.splitext(file.filename)[1].lower()
-            file_name_in_s3 = f"{db_appeal.id}_{sanitize_filename(os.path.splitext(file.filename)[0])}{file_ext}"
-
-            file_key = f"{user_folder}/{appeal_folder}/{file_name_in_s3}"
-
-            file.file.seek(0)
-            s3_client.upload_fileobj(
-                Fileobj=file.file,
-                Bucket=bucket_name,
-                Key=file_key,
-                ExtraArgs={'ACL': 'public-read'}
+            stored_files = await run_in_threadpool(
+                content_store.store_files, db, storage,
+                [(file.file, file.filename) for file in files_to_store], "create_appeal",
             )
-
-            file_url = f"https://storage.yandexcloud.net/{bucket_name}/{file_key}"
-            saved_file_paths.append(file_url)
-
         except ClientError as e:
-            print(f"Error uploading file to Yandex Cloud: {e}")
-            db.rollback()
-            raise HTTPException(status_code=500, detail=f"Ошибка загрузки файла '{file.filename}': {e}")
+            logger.error("Error uploading file to Yandex Cloud: %s", e)
+            pending.discard(db, pending_id, user_id, idempotency_key)
+            raise HTTPException(status_code=500, detail=f"Ошибка загрузки файла: {e}")
         except Exception as e:
-             db.rollback()
-             raise HTTPException(status_code=500, detail=f"Непредвиденная ошибка при загрузке файла '{file.filename}': {e}")
-
-    db_appeal.file_paths = json.dumps(saved_file_paths)
+             pending.discard(db, pending_id, user_id, idempotency_key)
+             raise HTTPException(status_code=500, detail=f"Непредвиденная ошибка при загрузке файла: {e}")
 
-    db.commit()
-    db.refresh(db_appeal)
+    try:
+        uploads.take_completed(db, user_id, upload_ids)
+        stored_keys = iter(content_store.link(db, stored_files))
+        saved_file_paths = [
+            storage.url(key if key is not None else next(stored_keys)) for key in upload_keys
+        ]
+        db_appeal = models.Appeal(
+            address=address,
+            category_id=category_id,
+            description=description,
+            user_id=user_id,
+            status_id=status_id_default,
+            file_paths=json.dumps(saved_file_paths),
+        )
+        db_appeal.assignee_id = assignment.pick_assignee(db)
+        db.add(db_appeal)
+        db.flush()
+        unread.track_appeal(db, db_appeal.id, user_id)
+        if db_appeal.assignee_id is not None:
+            unread.track_assignee(db, db_appeal.id, db_appeal.assignee_id)
+        pending.finish(db, pending_id)
+        db.refresh(db_appeal)
+
+        response = ORJSONResponse(serializers.appeal_to_dict(db_appeal))
+        if idempotency_key:
+            idempotency.complete(db, user_id, idempotency_key, response)
+        db.commit()
+    except Exception:
+        if pending_id is not None:
+            pending.discard(db, pending_id, user_id, idempotency_key)
+        raise
 
-    inspectors = db.query(models.User).filter(models.User.role == 'inspector', models.User.is_active == True).all()
-    if inspectors:
+    inspector_ids = assignment.inspector_recipients(db, db_appeal)
+    if inspector_ids:
         notification_title = "Новое обращение"
         sender_name = current_user.username
         notification_body = f"Поступило новое обращение '{db_appeal.address}' от пользователя {sender_name}."
         notification_data = {'appeal_id': str(db_appeal.id)}
-        for inspector in inspectors:
-            await send_fcm_notification(
-                user_id=inspector.id,
+        for inspector_id in inspector_ids:
+            await run_in_threadpool(
+                send_fcm_notification,
+                user_id=inspector_id,
                 title=notification_title,
                 body=notification_body,
                 data=notification_data,
                 db=db
             )
 
-    if db_appeal.file_paths:
-        db_appeal.file_paths = json.loads(db_appeal.file_paths)
-    else:
-        db_appeal.file_paths = []
+    return response
 
-    return db_appeal
+@router.post("/appeals/claim", response_model=schemas.Appeal, responses={204: {"description": "No unassigned appeals"}})
+def claim_appeal(
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_active_user)
+):
+    if current_user.role != "inspector":
+        raise HTTPException(status_code=403, detail="Only inspectors can claim appeals")
+
+    db_appeal = assignment.claim_next(db, current_user.id)
+    if db_appeal is None:
+        return Response(status_code=status.HTTP_204_NO_CONTENT)
+    db.commit()
+    db.refresh(db_appeal)
+    logger.info("Appeal %s claimed by inspector %s", db_appeal.id, current_user.id)
+    return ORJSONResponse(serializers.appeal_to_dict(db_appeal))
 
-@router.get("/appeals/", response_model=List[schemas.Appeal])
+@router.get("/appeals/", response_model=List[schemas.AppealFields])
 def read_appeals(
     skip: int = 0,
     limit: int = 100,
@@ -461,33 +565,39 @@ def read_appeals(
     sort_order: str = "desc",
     status_id: Optional[int] = None,
     category_id: Optional[int] = None,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_active_user)
+    assignee_id: Optional[int] = None,
+    fields: Optional[str] = Query(None, description="Comma-separated appeal fields, e.g. id,address,status_id,created_at"),
+    include: Optional[str] = Query(None, description="Comma-separated relations to embed: user,status,category"),
+    archived: bool = Query(False, description="List archived (closed and old) appeals instead of active ones"),
+    db: Session = Depends(get_read_db),
+    current_user: models.User = Depends(get_current_active_reader)
 ):
-    query = db.query(models.Appeal).options(
-        selectinload(models.Appeal.user),
-        selectinload(models.Appeal.status),
-        selectinload(models.Appeal.category)
-    )
+    selected_fields = tuple(dict.fromkeys(("id",) + parse_list_param(fields, serializers.APPEAL_FIELDS, serializers.APPEAL_FIELDS, "fields")))
+    selected_include = parse_list_param(include, ("user", "status", "category"), serializers.DEFAULT_APPEAL_INCLUDE, "include")
+
+    appeal_model = models.ArchivedAppeal if archived else models.Appeal
+    query = db.query(appeal_model).options(*appeal_load_options(selected_fields, selected_include, appeal_model))
 
     if current_user.role == "citizen":
-        query = query.filter(models.Appeal.user_id == current_user.id)
+        query = query.filter(appeal_model.user_id == current_user.id)
     elif current_user.role != "inspector":
          raise HTTPException(status_code=403, detail="Not enough permissions")
 
     if status_id is not None:
-        query = query.filter(models.Appeal.status_id == status_id)
+        query = query.filter(appeal_model.status_id == status_id)
     if category_id is not None:
-        query = query.filter(models.Appeal.category_id == category_id)
+        query = query.filter(appeal_model.category_id == category_id)
+    if assignee_id is not None:
+        query = query.filter(appeal_model.assignee_id == assignee_id)
 
     if sort_by == "address":
-        order_column = models.Appeal.address
+        order_column = appeal_model.address
     elif sort_by == "status_id":
-        order_column = models.Appeal.status_id
+        order_column = appeal_model.status_id
     elif sort_by == "category_id":
-        order_column = models.Appeal.category_id
+        order_column = appeal_model.category_id
     else:
-        order_column = models.Appeal.created_at
+        order_column = appeal_model.created_at
 
     if sort_order == "asc":
         query = query.order_by(asc(order_column))
@@ -495,42 +605,56 @@ def read_appeals(
         query = query.order_by(desc(order_column))
 
     appeals = query.offset(skip).limit(limit).all()
+    return ORJSONResponse(serializers.appeals_to_list(appeals, selected_fields, selected_include))
+
+@router.get("/appeals/sync", response_model=schemas.AppealSync)
+def sync_appeals(
+    token: Optional[str] = Query(None, description="sync_token from the previous response; omit for a full sync"),
+    limit: int = Query(500, ge=1, le=1000),
+    fields: Optional[str] = Query(None, description="Comma-separated appeal fields, e.g. id,address,status_id,updated_at"),
+    include: Optional[str] = Query(None, description="Comma-separated relations to embed: user,status,category"),
+    db: Session = Depends(get_read_db),
+    current_user: models.User = Depends(get_current_active_reader)
+):
+    selected_fields = tuple(dict.fromkeys(("id",) + parse_list_param(fields, serializers.APPEAL_FIELDS, serializers.APPEAL_FIELDS, "fields")))
+    selected_include = parse_list_param(include, ("user", "status", "category"), serializers.DEFAULT_APPEAL_INCLUDE, "include")
 
-    for appeal in appeals:
-        if appeal.file_paths:
-            try:
-                appeal.file_paths = json.loads(appeal.file_paths)
-            except json.JSONDecodeError:
-                appeal.file_paths = []
-        else:
-            appeal.file_paths = []
-
-    return appeals
+    page = sync.changes(
+        db, current_user, token, limit, appeal_load_options(selected_fields + ("updated_at",), selected_include)
+    )
+    return ORJSONResponse({
+        "appeals": serializers.appeals_to_list(page.appeals, selected_fields, selected_include),
+        "removed": page.removed,
+        "sync_token": sync.encode_token(page.token),
+        "has_more": page.has_more,
+        "reset": page.reset,
+    })
+
+@router.get("/appeals/{appeal_id}", response_model=schemas.AppealFields)
+def read_appeal(
+    appeal_id: int,
+    fields: Optional[str] = Query(None, description="Comma-separated appeal fields"),
+    include: Optional[str] = Query(None, description="Comma-separated relations to embed: user,status,category,messages"),
+    db: Session = Depends(get_read_db),
+    current_user: models.User = Depends(get_current_active_reader)
+):
+    selected_fields = tuple(dict.fromkeys(("id",) + parse_list_param(fields, serializers.APPEAL_FIELDS, serializers.APPEAL_FIELDS, "fields")))
+    selected_include = parse_list_param(include, serializers.APPEAL_INCLUDES, serializers.DEFAULT_APPEAL_INCLUDE, "include")
 
-@router.get("/appeals/{appeal_id}", response_model=schemas.Appeal)
-def read_appeal(appeal_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_active_user)):
     db_appeal = db.query(models.Appeal).options(
-        selectinload(models.Appeal.user),
-        selectinload(models.Appeal.status),
-        selectinload(models.Appeal.category),
-        selectinload(models.Appeal.messages).selectinload(models.Message.sender)
+        *appeal_load_options(selected_fields, selected_include)
     ).filter(models.Appeal.id == appeal_id).first()
+    if db_appeal is None:
+        db_appeal = db.query(models.ArchivedAppeal).options(
+            *appeal_load_options(selected_fields, selected_include, models.ArchivedAppeal, models.ArchivedMessage)
+        ).filter(models.ArchivedAppeal.id == appeal_id).first()
 
     if db_appeal is None:
         raise HTTPException(status_code=404, detail="Appeal not found")
     if current_user.role == "citizen" and db_appeal.user_id != current_user.id:
         raise HTTPException(status_code=403, detail="Not authorized to access this appeal")
 
-    if db_appeal.file_paths:
-        try:
-            temp_files = json.loads(db_appeal.file_paths)
-        except json.JSONDecodeError:
-             print(f"Error decoding appeal file_paths JSON for appeal ID {db_appeal.id}")
-             pass
-    else:
-         pass
-
-    return db_appeal
+    return ORJSONResponse(serializers.appeal_to_dict(db_appeal, fields=selected_fields, include=selected_include))
 
 @router.put("/appeals/{appeal_id}", response_model=schemas.Appeal)
 async def update_appeal(
@@ -577,7 +701,8 @@ async def update_appeal(
         if status_name == "Требует уточнений":
             citizen_body += " Пожалуйста, проверьте чат."
 
-        await send_fcm_notification(
+        await run_in_threadpool(
+            send_fcm_notification,
             user_id=user_id_to_notify_citizen,
             title=citizen_title,
             body=citizen_body,
@@ -586,24 +711,19 @@ async def update_appeal(
         )
 
         if status_name == "Требует уточнений":
-            inspectors = db.query(models.User).filter(models.User.role == 'inspector', models.User.is_active == True).all()
             inspector_title = "Обращение требует уточнений"
             inspector_body = f"Обращение '{db_appeal.address}' переведено в статус 'Требует уточнений'."
-            for inspector in inspectors:
-                 await send_fcm_notification(
-                     user_id=inspector.id,
+            for inspector_id in assignment.inspector_recipients(db, db_appeal):
+                 await run_in_threadpool(
+                     send_fcm_notification,
+                     user_id=inspector_id,
                      title=inspector_title,
                      body=inspector_body,
                      data=notification_data,
                      db=db
                  )
 
-    if db_appeal.file_paths:
-        db_appeal.file_paths = json.loads(db_appeal.file_paths)
-    else:
-         db_appeal.file_paths = []
-
-    return db_appeal
+    return ORJSONResponse(serializers.appeal_to_dict(db_appeal))
 
 # @router.delete("/appeals/{appeal_id}")
 # def delete_appeal(appeal_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_active_user)):
@@ -661,257 +781,271 @@ async def update_appeal(
 #     db.commit()
 #     return {"message": "Appeal deleted"}
 
-@router.get("/appeals/{appeal_id}/messages", response_model=List[schemas.Message])
+@router.get(
+    "/appeals/{appeal_id}/messages",
+    response_model=List[schemas.Message],
+    dependencies=[Depends(rate_limited("read_messages", get_current_active_reader))],
+)
 def read_messages(
     appeal_id: int,
     skip: int = 0,
     limit: int = 100,
     last_message_id: Optional[int] = None,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_active_user)
+    latest: bool = Query(False, description="Return the newest `limit` messages instead of the oldest"),
+    before_id: Optional[int] = Query(None, description="Return the newest `limit` messages older than this id"),
+    db: Session = Depends(get_read_db),
+    current_user: models.User = Depends(get_current_active_reader)
 ):
-    logger.info(f"--- Handling read_messages for appeal {appeal_id} (last_id={last_message_id}) ---")
+    logger.debug("read_messages: appeal=%s last_id=%s before_id=%s", appeal_id, last_message_id, before_id)
+    message_model = models.Message
     db_appeal = db.query(models.Appeal).filter(models.Appeal.id == appeal_id).first()
     if db_appeal is None:
-        logger.warning(f"read_messages: Appeal {appeal_id} not found.")
+        message_model = models.ArchivedMessage
+        db_appeal = db.query(models.ArchivedAppeal).filter(models.ArchivedAppeal.id == appeal_id).first()
+    if db_appeal is None:
+        logger.warning("read_messages: Appeal %s not found.", appeal_id)
         raise HTTPException(status_code=404, detail="Appeal not found")
 
     if current_user.role != "inspector" and current_user.id != db_appeal.user_id:
-         logger.warning(f"read_messages: User {current_user.username} not authorized for appeal {appeal_id}.")
+         logger.warning("read_messages: User %s not authorized for appeal %s.", current_user.username, appeal_id)
          raise HTTPException(status_code=403, detail="Not authorized to view messages for this appeal")
 
-    query = db.query(models.Message).options(
-        selectinload(models.Message.sender)
-    ).filter(models.Message.appeal_id == appeal_id)
+    query = db.query(message_model).options(
+        selectinload(message_model.sender)
+    ).filter(message_model.appeal_id == appeal_id)
 
     if last_message_id is not None:
-        query = query.filter(models.Message.id > last_message_id)
-
-    messages_orm = query.order_by(models.Message.id).offset(skip).limit(limit).all()
-    logger.info(f"read_messages: Found {len(messages_orm)} messages in DB.")
-
-    response_list = []
-    for msg_orm in messages_orm:
-        decoded_paths_list: Optional[List[str]] = None
-        if msg_orm.file_paths:
-            try:
-                decoded_paths = json.loads(msg_orm.file_paths)
-                if isinstance(decoded_paths, list):
-                    decoded_paths_list = [str(item) for item in decoded_paths]
-                else:
-                    logger.warning(f"Decoded file_paths for message {msg_orm.id} is not a list: {type(decoded_paths)}")
-                    decoded_paths_list = []
-            except json.JSONDecodeError:
-                logger.error(f"Error decoding file_paths JSON for message ID {msg_orm.id}: '{msg_orm.file_paths}'", exc_info=True)
-                decoded_paths_list = []
-
-        try:
-            msg_pydantic = schemas.Message(
-                id=msg_orm.id,
-                appeal_id=msg_orm.appeal_id,
-                sender_id=msg_orm.sender_id,
-                content=msg_orm.content,
-                created_at=msg_orm.created_at,
-                sender=msg_orm.sender,
-                file_paths=decoded_paths_list
-            )
-            response_list.append(msg_pydantic)
-        except Exception as e:
-            logger.error(f"Error validating message id={msg_orm.id} with Pydantic schema: {e}", exc_info=True)
-            pass
-
-    logger.info(f"read_messages: Returning {len(response_list)} messages in response.")
-    return response_list
-
-@router.post("/appeals/{appeal_id}/messages", response_model=schemas.Message)
+        query = query.filter(message_model.id > last_message_id)
+    if before_id is not None:
+        query = query.filter(message_model.id < before_id)
+
+    if latest or before_id is not None:
+        # Walk the (appeal_id, id) index from the newest end, so a page costs the
+        # same however long the chat is; the page is still returned oldest first.
+        messages_orm = query.order_by(message_model.id.desc()).offset(skip).limit(limit).all()
+        messages_orm.reverse()
+    else:
+        messages_orm = query.order_by(message_model.id).offset(skip).limit(limit).all()
+    logger.debug("read_messages: Returning %d messages for appeal %s.", len(messages_orm), appeal_id)
+    return ORJSONResponse(serializers.messages_to_list(messages_orm))
+
+@router.post(
+    "/appeals/{appeal_id}/messages",
+    response_model=schemas.Message,
+    dependencies=[Depends(rate_limited("create_message")), Depends(upload_slot)],
+)
 async def create_message(
     appeal_id: int,
     content: Annotated[Optional[str], Form()] = None,
     files: Annotated[List[UploadFile], File()] = [],
+    upload_ids: Annotated[List[str], Form()] = [],
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_active_user),
-    s3_client = Depends(get_s3_client)
+    storage: Storage = Depends(get_storage),
+    idempotency_key: Optional[str] = Header(None, max_length=255),
 ):
-    logger.info(f"--- Handling create_message for appeal {appeal_id} by user {current_user.username} ---")
-    logger.info(f"Received content via Form: '{content}' (Type: {type(content)})")
-    logger.info(f"Received files via File: Count={len(files)}")
-    for i, f in enumerate(files):
-        logger.info(f"  File {i}: filename='{f.filename}', content_type='{f.content_type}'")
+    logger.debug(
+        "create_message: appeal=%s user=%s content_length=%d files=%d",
+        appeal_id, current_user.username, len(content or ""), len(files),
+    )
 
-    if not content and not files:
+    if not content and not files and not upload_ids:
          logger.warning("Attempted to send an empty message (no content, no files).")
          raise HTTPException(status_code=400, detail="Cannot send an empty message.")
 
     message_content = content if content is not None else ""
-    logger.info(f"Using message_content: '{message_content}' for DB")
 
     db_appeal = db.query(models.Appeal).options(
         selectinload(models.Appeal.user)
     ).filter(models.Appeal.id == appeal_id).first()
 
     if db_appeal is None:
-        logger.error(f"Appeal with id={appeal_id} not found.")
+        logger.error("Appeal with id=%s not found.", appeal_id)
         raise HTTPException(status_code=404, detail="Appeal not found")
 
     if current_user.id != db_appeal.user_id and current_user.role != "inspector":
-        logger.warning(f"User {current_user.username} not authorized for appeal {appeal_id}.")
+        logger.warning("User %s not authorized for appeal %s.", current_user.username, appeal_id)
         raise HTTPException(status_code=403, detail="Not authorized to send messages to this appeal")
 
-    db_message = models.Message(
-        appeal_id=appeal_id,
-        sender_id=current_user.id,
-        content=message_content,
-        file_paths=None
-    )
-    db.add(db_message)
-    try:
-        db.flush()
-        db.refresh(db_message)
-        logger.info(f"Created initial message record with id={db_message.id}")
-    except Exception as e:
-        logger.error(f"Error flushing/refreshing initial message: {e}", exc_info=True)
-        db.rollback()
-        raise HTTPException(status_code=500, detail="Ошибка создания записи сообщения в БД")
-
-    saved_file_paths = []
-    if files:
-        bucket_name = os.environ.get("YC_BUCKET_NAME")
-        appeal_user = db_appeal.user
-        if not appeal_user:
-             logger.error("Appeal user not found after loading appeal (should not happen).")
-             db.rollback()
-             raise HTTPException(status_code=500, detail="Appeal user not found")
-
-        user_folder = sanitize_filename(appeal_user.username)
-        appeal_folder_name = f"{db_appeal.id}_{sanitize_filename(db_appeal.address)}"
-
-        chat_folder_prefix = f"{user_folder}/{appeal_folder_name}/chat/{db_message.id}/"
-        logger.info(f"Attempting to upload files to prefix: {chat_folder_prefix}")
-
-        for file in files:
-            if file.filename:
-                try:
-                    unique_filename = f"{uuid.uuid4()}_{sanitize_filename(file.filename)}"
-                    file_key = f"{chat_folder_prefix}{unique_filename}"
-
-                    file.file.seek(0)
-                    s3_client.upload_fileobj(
-                        Fileobj=file.file,
-                        Bucket=bucket_name,
-                        Key=file_key,
-                        ExtraArgs={'ACL': 'public-read'}
-                    )
-                    file_url = f"https://storage.yandexcloud.net/{bucket_name}/{file_key}"
-                    saved_file_paths.append(file_url)
-                    logger.info(f"Successfully uploaded '{file.filename}' to {file_url}")
-                except ClientError as e:
-                    logger.error(f"S3 ClientError uploading '{file.filename}': {e}", exc_info=True)
-                    db.rollback()
-                    raise HTTPException(status_code=500, detail=f"Ошибка S3 при загрузке файла '{file.filename}': {e}")
-                except Exception as e:
-                     logger.error(f"Unexpected error uploading '{file.filename}': {e}", exc_info=True)
-                     db.rollback()
-                     raise HTTPException(status_code=500, detail=f"Ошибка при загрузке файла '{file.filename}': {e}")
-                finally:
-                    await file.close()
-                    logger.info(f"Closed file object for '{file.filename}'")
-            else:
-                 logger.warning("Skipping file with empty filename.")
-
-    if saved_file_paths:
+    if idempotency_key:
+        file_digests = await run_in_threadpool(content_store.upload_digests, files)
+        request_fingerprint = idempotency.fingerprint("create_message", appeal_id, message_content, file_digests, upload_ids)
+        replay = idempotency.begin(db, current_user.id, idempotency_key, request_fingerprint)
+        if replay is not None:
+            return replay
+    attached_uploads = uploads.take_completed(db, current_user.id, upload_ids, attach=False)
+
+    upload_urls = [storage.url(upload.s3_key) for upload in attached_uploads]
+    files_to_store = [file for file in files if file.filename]
+    if len(files_to_store) != len(files):
+        logger.warning("Skipping %d files with empty filename.", len(files) - len(files_to_store))
+    user_id = current_user.id
+    appeal_owner_id = db_appeal.user_id
+
+    stored_files = []
+    pending_id = None
+    if files_to_store:
+        # No transaction or pooled connection is held while the files travel to
+        # object storage. The message is inserted afterwards, so its id never
+        # shows up ahead of messages committed in the meantime.
+        pending_id = pending.reserve(db, user_id, "create_message", idempotency_key)
+        db.commit()
+        logger.debug("Storing %d files for appeal id=%s", len(files_to_store), appeal_id)
         try:
-            message_to_update = db.query(models.Message).filter(models.Message.id == db_message.id).first()
-            if message_to_update:
-                 message_to_update.file_paths = json.dumps(saved_file_paths)
-                 logger.info(f"Updating message id={message_to_update.id} with file paths: {message_to_update.file_paths}")
-                 db.add(message_to_update)
-            else:
-                 logger.error(f"Could not find message id={db_message.id} to update file paths.")
-                 db.rollback()
-                 raise HTTPException(status_code=500, detail="Ошибка обновления путей к файлам сообщения")
+            stored_files = await run_in_threadpool(
+                content_store.store_files, db, storage,
+                [(file.file, file.filename) for file in files_to_store], "create_message",
+            )
+        except ClientError as e:
+            logger.error("S3 ClientError uploading message files for appeal id=%s: %s", appeal_id, e, exc_info=True)
+            pending.discard(db, pending_id, user_id, idempotency_key)
+            raise HTTPException(status_code=500, detail=f"Ошибка S3 при загрузке файлов: {e}")
         except Exception as e:
-            logger.error(f"Error setting file paths for message id={db_message.id}: {e}", exc_info=True)
-            db.rollback()
-            raise HTTPException(status_code=500, detail="Ошибка сохранения путей к файлам")
-
+            logger.error("Unexpected error uploading message files for appeal id=%s: %s", appeal_id, e, exc_info=True)
+            pending.discard(db, pending_id, user_id, idempotency_key)
+            raise HTTPException(status_code=500, detail=f"Ошибка при загрузке файлов: {e}")
+        finally:
+            for file in files_to_store:
+                await file.close()
 
     try:
-        db.commit()
+        uploads.take_completed(db, user_id, upload_ids)
+        saved_file_paths = [storage.url(key) for key in content_store.link(db, stored_files)] + upload_urls
+        db_message = models.Message(
+            appeal_id=appeal_id,
+            sender_id=user_id,
+            content=message_content,
+            file_paths=json.dumps(saved_file_paths) if saved_file_paths else None,
+        )
+        db.add(db_message)
+        db.flush()
+        message_id = db_message.id
+        unread.record_message(db, appeal_id, appeal_owner_id, user_id, message_id)
+        pending.finish(db, pending_id)
         db.refresh(db_message)
-        logger.info(f"Successfully committed message id={db_message.id}")
+        response = ORJSONResponse(serializers.message_to_dict(db_message))
+        if idempotency_key:
+            idempotency.complete(db, user_id, idempotency_key, response)
+        db.commit()
+        logger.debug("Committed message id=%s", message_id)
+    except HTTPException:
+        if pending_id is not None:
+            pending.discard(db, pending_id, user_id, idempotency_key)
+        raise
     except Exception as e:
-        logger.error(f"Error committing message transaction for id={db_message.id}: {e}", exc_info=True)
-        db.rollback()
+        logger.error("Error committing message transaction for appeal id=%s: %s", appeal_id, e, exc_info=True)
+        if pending_id is not None:
+            pending.discard(db, pending_id, user_id, idempotency_key)
+        else:
+            db.rollback()
         raise HTTPException(status_code=500, detail="Ошибка сохранения сообщения в БД")
 
-    final_message = db.query(models.Message).options(
-         selectinload(models.Message.sender)
-    ).filter(models.Message.id == db_message.id).first()
-
-    if not final_message:
-         logger.error(f"Could not reload message id={db_message.id} after commit.")
-
-         raise HTTPException(status_code=500, detail="Не удалось получить сохраненное сообщение")
-
     try:
         notification_data = {'appeal_id': str(appeal_id)}
         sender_name = current_user.username
-        notification_body_suffix = " (с файлами)" if final_message.file_paths else ""
+        appeal_address = db_appeal.address
+        notification_body_suffix = " (с файлами)" if saved_file_paths else ""
 
         if current_user.id == db_appeal.user_id:
-            inspectors = db.query(models.User).filter(models.User.role == 'inspector', models.User.is_active == True).all()
-            if inspectors:
+            inspector_ids = assignment.inspector_recipients(db, db_appeal)
+            if inspector_ids:
                 notification_title = "Новое сообщение от гражданина"
                 notification_body = f"Пользователь {sender_name} отправил сообщение по обращению '{db_appeal.address}'.{notification_body_suffix}"
-                for inspector in inspectors:
-                    if inspector.id != current_user.id:
-                        await send_fcm_notification(
-                            user_id=inspector.id, title=notification_title, body=notification_body, data=notification_data, db=db
+                notification_summary = lambda count: f"Новых сообщений по обращению '{appeal_address}': {count}."
+                for inspector_id in inspector_ids:
+                    if inspector_id != current_user.id:
+                        chat_notifications.add(
+                            inspector_id, appeal_id, notification_title, notification_body, notification_summary, notification_data
                         )
         elif current_user.role == 'inspector':
             recipient_user_id = db_appeal.user_id
             if recipient_user_id != current_user.id:
                 notification_title = "Новое сообщение от инспектора"
                 notification_body = f"Инспектор {sender_name} отправил сообщение по вашему обращению '{db_appeal.address}'.{notification_body_suffix}"
-                await send_fcm_notification(
-                    user_id=recipient_user_id, title=notification_title, body=notification_body, data=notification_data, db=db
+                notification_summary = lambda count: f"Новых сообщений по вашему обращению '{appeal_address}': {count}."
+                chat_notifications.add(
+                    recipient_user_id, appeal_id, notification_title, notification_body, notification_summary, notification_data
                 )
-        logger.info(f"Notifications initiated for message id={final_message.id}")
+        logger.debug("Notifications initiated for message id=%s", db_message.id)
     except Exception as e:
-        logger.error(f"Error sending FCM notification for message id={final_message.id}: {e}", exc_info=True)
+        logger.error("Error sending FCM notification for message id=%s: %s", db_message.id, e, exc_info=True)
 
-    try:
-        decoded_paths_list: Optional[List[str]] = None
-
-        if final_message.file_paths:
-            try:
-                decoded_paths = json.loads(final_message.file_paths)
-                if isinstance(decoded_paths, list):
-                    decoded_paths_list = [str(item) for item in decoded_paths]
-                    logger.info(f"Successfully decoded file_paths for message {final_message.id}")
-                else:
-                    logger.warning(f"Decoded file_paths for message {final_message.id} is not a list: {type(decoded_paths)}")
-                    decoded_paths_list = []
-            except json.JSONDecodeError:
-                logger.error(f"Error decoding file_paths JSON for message ID {final_message.id}: '{final_message.file_paths}'", exc_info=True)
-                decoded_paths_list = []
-
-        api_response_model = schemas.Message(
-            id=final_message.id,
-            appeal_id=final_message.appeal_id,
-            sender_id=final_message.sender_id,
-            content=final_message.content,
-            created_at=final_message.created_at,
-            sender=final_message.sender,
-            file_paths=decoded_paths_list
-        )
+    return response
 
-        logger.info(f"Successfully created Pydantic model instance for message id={final_message.id}")
-        return api_response_model
+@router.post("/appeals/{appeal_id}/read")
+def mark_appeal_read(
+    appeal_id: int,
+    message_id: Optional[int] = Query(None, description="Last message the user has seen; defaults to the latest one"),
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_active_user)
+):
+    db_appeal = db.query(models.Appeal).options(load_only(models.Appeal.user_id)).filter(models.Appeal.id == appeal_id).first()
+    if db_appeal is None:
+        raise HTTPException(status_code=404, detail="Appeal not found")
+    if current_user.role != "inspector" and current_user.id != db_appeal.user_id:
+        raise HTTPException(status_code=403, detail="Not authorized to access this appeal")
 
-    except Exception as e:
-        logger.error(f"Error creating/validating Pydantic response model for message id={final_message.id}: {e}", exc_info=True)
-        raise HTTPException(status_code=500, detail="Ошибка формирования ответа сервера")
+    state = unread.mark_read(db, current_user.id, appeal_id, message_id)
+    db.commit()
+    return state
+
+@router.get("/users/me/unread")
+def read_unread_counts(
+    db: Session = Depends(get_read_db),
+    current_user: models.User = Depends(get_current_active_reader)
+):
+    return ORJSONResponse(unread.unread_counts(db, current_user.id))
+
+@router.post("/uploads", status_code=status.HTTP_201_CREATED)
+def create_upload_session(
+    upload: schemas.UploadSessionCreate,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_active_user),
+    storage: Storage = Depends(get_storage)
+):
+    session = uploads.start(
+        db, storage, current_user.id, f"uploads/{sanitize_filename(current_user.username)}/",
+        sanitize_filename(upload.filename), upload.size, upload.content_type,
+    )
+    return uploads.describe(session, storage)
+
+@router.get("/uploads/{upload_id}")
+def read_upload_session(
+    upload_id: str,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_active_user),
+    storage: Storage = Depends(get_storage)
+):
+    return uploads.describe(uploads.get_owned(db, upload_id, current_user.id), storage)
+
+@router.put("/uploads/{upload_id}/chunks", dependencies=[Depends(upload_slot)])
+async def upload_chunk(
+    upload_id: str,
+    request: Request,
+    offset: int = Query(..., ge=0),
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_active_user),
+    storage: Storage = Depends(get_storage)
+):
+    data = await uploads.read_chunk(request)
+
+    def store():
+        session = uploads.get_owned(db, upload_id, current_user.id)
+        uploads.put_chunk(db, storage, session, offset, data)
+        return uploads.describe(session, storage)
+
+    return await run_in_threadpool(store)
+
+@router.post("/uploads/{upload_id}/complete")
+def complete_upload_session(
+    upload_id: str,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_active_user),
+    storage: Storage = Depends(get_storage)
+):
+    session = uploads.get_owned(db, upload_id, current_user.id, lock=True)
+    uploads.complete(db, storage, session)
+    return uploads.describe(session, storage)
 
 @router.post("/appeal_statuses/", response_model=schemas.AppealStatus)
 def create_appeal_status(status: schemas.AppealStatusCreate, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_active_user)):
@@ -929,7 +1063,7 @@ def create_appeal_status(status: schemas.AppealStatusCreate, db: Session = Depen
     return db_status
 
 @router.get("/appeal_statuses/", response_model=List[schemas.AppealStatus])
-def read_appeal_statuses(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+def read_appeal_statuses(skip: int = 0, limit: int = 100, db: Session = Depends(get_read_db)):
     statuses = db.query(models.AppealStatus).offset(skip).limit(limit).all()
     return statuses
 
@@ -983,7 +1117,7 @@ def create_appeal_category(category: schemas.AppealCategoryCreate, db: Session =
     return db_category
 
 @router.get("/appeal_categories/", response_model=List[schemas.AppealCategory])
-def read_appeal_categories(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+def read_appeal_categories(skip: int = 0, limit: int = 100, db: Session = Depends(get_read_db)):
     categories = db.query(models.AppealCategory).offset(skip).limit(limit).all()
     return categories
 
@@ -1022,6 +1156,31 @@ def delete_appeal_category(category_id: int, db: Session = Depends(get_db), curr
     db.commit()
     return {"message": "Category deleted"}
 
+@router.get("/bootstrap")
+async def read_bootstrap(
+    appeals_limit: int = Query(20, ge=1, le=100),
+    fcm_token: Optional[str] = Query(None, description="Device token to check registration for"),
+    if_none_match: Optional[str] = Header(None),
+    db: Session = Depends(get_read_db),
+    current_user: models.User = Depends(get_current_active_reader)
+):
+    user = serializers.user_to_dict(current_user)
+    # The sections use sessions of their own; give this one's connection back.
+    db.rollback()
+
+    sections = await bootstrap.load(
+        read_sessionmaker(user["id"]), user, appeals_limit,
+        appeal_load_options(serializers.APPEAL_FIELDS, serializers.DEFAULT_APPEAL_INCLUDE), fcm_token,
+    )
+    known_etags = bootstrap.parse_if_none_match(if_none_match)
+    etags = {name: bootstrap.section_etag(name, data) for name, data in sections.items()}
+    if known_etags and set(etags.values()) <= known_etags:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED)
+
+    content = {name: None if etags[name] in known_etags else data for name, data in sections.items()}
+    content["etags"] = etags
+    return ORJSONResponse(content)
+
 @router.post("/users/me/devices", status_code=status.HTTP_201_CREATED)
 def register_device(
     token_data: schemas.DeviceTokenCreate,
@@ -1071,28 +1230,3 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
     return {"access_token": access_token, "token_type": "bearer"}
 
 app.include_router(router)
-
-@app.on_event("startup")
-async def startup_event():
-    Base.metadata.create_all(bind=engine)
-    with SessionLocal() as db:
-        if not db.query(models.AppealStatus).first():
-            statuses = [
-                models.AppealStatus(name="Новое"),
-                models.AppealStatus(name="В работе"),
-                models.AppealStatus(name="Требует уточнений"),
-                models.AppealStatus(name="Отклонено"),
-                models.AppealStatus(name="Выполнено"),
-            ]
-            db.add_all(statuses)
-            db.commit()
-        if not db.query(models.AppealCategory).first():
-            categories = [
-                models.AppealCategory(name="Объединение комнат"),
-                models.AppealCategory(name="Перенос санузла"),
-                models.AppealCategory(name="Перенос кухни"),
-                models.AppealCategory(name="Устройство проемов в несущих стенах"),
-                models.AppealCategory(name="Другое"),
-            ]
-            db.add_all(categories)
-            db.commit()
\ No newline at end of file
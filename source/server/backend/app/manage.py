@@ -0,0 +1,119 @@
+import argparse
+import logging
+import sys
+from datetime import timedelta
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from . import archive, idempotency, models, pending, storage_gc, sync, uploads
+from .database import get_engine
+from .storage import get_storage
+
+logger = logging.getLogger(__name__)
+
+# Arbitrary application-wide key for pg_advisory_lock, so that concurrent
+# deploy jobs run the schema setup one after another.
+SCHEMA_LOCK_ID = 7345001
+
+# create_all() only creates missing tables. Columns and indexes added to
+# existing tables are listed here; every statement must be safe to rerun.
+SCHEMA_UPGRADES = [
+    "ALTER TABLE appeals ADD COLUMN IF NOT EXISTS assignee_id INTEGER REFERENCES users (id)",
+    "ALTER TABLE archived_appeals ADD COLUMN IF NOT EXISTS assignee_id INTEGER REFERENCES users (id)",
+    "CREATE INDEX IF NOT EXISTS ix_appeals_assignee_id ON appeals (assignee_id)",
+    "CREATE INDEX IF NOT EXISTS ix_appeals_unassigned ON appeals (created_at, id) WHERE assignee_id IS NULL",
+    "CREATE INDEX IF NOT EXISTS ix_appeals_updated_at_id ON appeals (updated_at, id)",
+    "CREATE INDEX IF NOT EXISTS ix_appeals_user_id_created_at ON appeals (user_id, created_at)",
+    "CREATE INDEX IF NOT EXISTS ix_appeals_created_at ON appeals (created_at)",
+    "CREATE INDEX IF NOT EXISTS ix_messages_appeal_id_id ON messages (appeal_id, id)",
+    "CREATE INDEX IF NOT EXISTS ix_archived_messages_appeal_id_id ON archived_messages (appeal_id, id)",
+    "DROP INDEX IF EXISTS ix_archived_messages_appeal_id",
+]
+
+DEFAULT_STATUSES = ["Новое", "В работе", "Требует уточнений", "Отклонено", "Выполнено"]
+DEFAULT_CATEGORIES = [
+    "Объединение комнат",
+    "Перенос санузла",
+    "Перенос кухни",
+    "Устройство проемов в несущих стенах",
+    "Другое",
+]
+
+
+def init_db():
+    engine = get_engine()
+    with engine.begin() as connection:
+        if connection.dialect.name == "postgresql":
+            connection.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": SCHEMA_LOCK_ID})
+        models.Base.metadata.create_all(bind=connection)
+        if connection.dialect.name == "postgresql":
+            for statement in SCHEMA_UPGRADES:
+                connection.execute(text(statement))
+
+        db = Session(bind=connection)
+        if not db.query(models.AppealStatus).first():
+            db.add_all([models.AppealStatus(name=name) for name in DEFAULT_STATUSES])
+        if not db.query(models.AppealCategory).first():
+            db.add_all([models.AppealCategory(name=name) for name in DEFAULT_CATEGORIES])
+        db.flush()
+        db.close()
+    logger.info("Database schema and reference data are up to date.")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m app.manage")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("init-db", help="Create tables and seed appeal statuses and categories")
+    archive_parser = commands.add_parser("archive-appeals", help="Move old closed appeals and their messages to the archive tables")
+    archive_parser.add_argument("--older-than-days", type=int, default=archive.ARCHIVE_AFTER_DAYS)
+    archive_parser.add_argument("--batch-size", type=int, default=500)
+    commands.add_parser("purge-idempotency-keys", help="Delete expired Idempotency-Key records")
+    gc_uploads_parser = commands.add_parser("gc-uploads", help="Abort abandoned resumable uploads and delete unattached files")
+    gc_uploads_parser.add_argument("--older-than-hours", type=float, default=uploads.UPLOAD_SESSION_TTL.total_seconds() / 3600)
+    cleanup_pending_parser = commands.add_parser("cleanup-pending", help="Drop reservations of appeals and messages whose attachments never finished uploading")
+    cleanup_pending_parser.add_argument("--older-than-minutes", type=float, default=pending.PENDING_RECORD_TTL.total_seconds() / 60)
+    tombstones_parser = commands.add_parser("purge-tombstones", help="Delete appeal tombstones older than the sync token lifetime")
+    tombstones_parser.add_argument("--older-than-days", type=float, default=sync.TOMBSTONE_RETENTION.total_seconds() / 86400)
+    gc_storage_parser = commands.add_parser("gc-storage", help="Delete bucket objects no appeal, message or upload refers to")
+    gc_storage_parser.add_argument("--grace-hours", type=float, default=storage_gc.STORAGE_GC_GRACE.total_seconds() / 3600)
+    gc_storage_parser.add_argument("--prefix", default="")
+    gc_storage_parser.add_argument("--dry-run", action="store_true", help="Only report what would be deleted")
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    if args.command == "init-db":
+        init_db()
+    elif args.command == "archive-appeals":
+        archived = archive.archive_closed_appeals(args.older_than_days, args.batch_size)
+        logger.info("Archived %d appeals.", archived)
+    elif args.command == "purge-idempotency-keys":
+        with Session(bind=get_engine()) as db:
+            deleted = idempotency.purge_expired(db)
+        logger.info("Deleted %d expired idempotency keys.", deleted)
+    elif args.command == "gc-uploads":
+        with Session(bind=get_engine()) as db:
+            removed = uploads.collect_garbage(db, get_storage(), timedelta(hours=args.older_than_hours))
+        logger.info("Removed %d abandoned upload sessions.", removed)
+    elif args.command == "cleanup-pending":
+        with Session(bind=get_engine()) as db:
+            removed = pending.cleanup(db, timedelta(minutes=args.older_than_minutes))
+        logger.info("Removed %d unfinished pending uploads.", removed)
+    elif args.command == "purge-tombstones":
+        with Session(bind=get_engine()) as db:
+            deleted = sync.purge_tombstones(db, timedelta(days=args.older_than_days))
+        logger.info("Deleted %d appeal tombstones.", deleted)
+    elif args.command == "gc-storage":
+        try:
+            stats = storage_gc.collect_orphans(get_storage(), timedelta(hours=args.grace_hours), args.dry_run, args.prefix)
+        except storage_gc.UnmappedUrlsError as e:
+            logger.error("%s", e)
+            sys.exit(1)
+        logger.info(
+            "Scanned %d objects: %d orphans (%d bytes), %d deleted.",
+            stats["scanned"], stats["orphans"], stats["orphan_bytes"], stats["deleted"],
+        )
+
+
+if __name__ == "__main__":
+    main()
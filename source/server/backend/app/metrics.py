@@ -0,0 +1,179 @@
+import os
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+)
+from sqlalchemy import event
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by route template and status code",
+    ["method", "route", "status"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "http_requests_in_flight",
+    "HTTP requests currently being processed",
+    multiprocess_mode="livesum",
+)
+REQUEST_DB_QUERIES = Histogram(
+    "http_request_db_queries",
+    "Number of SQL statements executed per request",
+    ["route"],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100),
+)
+REQUEST_DB_DURATION = Histogram(
+    "http_request_db_duration_seconds",
+    "Total time spent in SQL statements per request",
+    ["route"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+READ_SESSIONS = Counter(
+    "db_read_sessions_total",
+    "Sessions opened for read-only endpoints, by target (replica, pinned, primary)",
+    ["target"],
+)
+STORAGE_UPLOAD_BYTES = Counter(
+    "storage_upload_bytes_total",
+    "Bytes uploaded to object storage",
+    ["endpoint"],
+)
+STORAGE_UPLOAD_LATENCY = Histogram(
+    "storage_upload_duration_seconds",
+    "Latency of single object storage uploads",
+    ["endpoint"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+STORAGE_UPLOAD_FAILURES = Counter(
+    "storage_upload_failures_total",
+    "Failed object storage uploads",
+    ["endpoint"],
+)
+STORAGE_DEDUP_HITS = Counter(
+    "storage_dedup_hits_total",
+    "Attachments linked to an already stored object instead of being uploaded",
+    ["endpoint"],
+)
+STORAGE_DEDUP_BYTES = Counter(
+    "storage_dedup_bytes_total",
+    "Upload bytes skipped thanks to content deduplication",
+    ["endpoint"],
+)
+STORAGE_GC_SCANNED = Counter(
+    "storage_gc_objects_scanned_total",
+    "Bucket objects listed by the orphaned object collector",
+)
+STORAGE_GC_ORPHANS = Counter(
+    "storage_gc_orphans_total",
+    "Unreferenced objects past the grace period, by whether the run was a dry run",
+    ["dry_run"],
+)
+STORAGE_GC_DELETED = Counter(
+    "storage_gc_deleted_total",
+    "Orphaned objects deleted from the bucket",
+)
+STORAGE_GC_DELETED_BYTES = Counter(
+    "storage_gc_deleted_bytes_total",
+    "Bytes freed by deleting orphaned objects",
+)
+FCM_SENDS = Counter(
+    "fcm_send_total",
+    "FCM messages sent, by result",
+    ["result"],
+)
+NOTIFICATIONS_COALESCED = Counter(
+    "notifications_coalesced_total",
+    "Chat pushes held back and merged into a later summary push",
+)
+FCM_SEND_LATENCY = Histogram(
+    "fcm_send_duration_seconds",
+    "Latency of single FCM send calls",
+    buckets=(0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+
+
+class RequestStats:
+    __slots__ = ("queries", "db_seconds")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+
+
+# The middleware stores a mutable RequestStats here; worker threads running sync
+# endpoints get a copy of the context, so they update the same object.
+_request_stats: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("metrics_query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info["metrics_query_start"].pop()
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.db_seconds += time.perf_counter() - started
+
+
+def instrument_engine(engine):
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        stats = RequestStats()
+        token = _request_stats.set(stats)
+        REQUESTS_IN_FLIGHT.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            REQUESTS_IN_FLIGHT.dec()
+            _request_stats.reset(token)
+            route = scope.get("route")
+            route_name = route.path if route is not None else "unmatched"
+            REQUEST_LATENCY.labels(scope["method"], route_name, str(status_code)).observe(elapsed)
+            REQUEST_DB_QUERIES.labels(route_name).observe(stats.queries)
+            REQUEST_DB_DURATION.labels(route_name).observe(stats.db_seconds)
+
+
+def observe_upload(endpoint: str, size: int, seconds: float):
+    STORAGE_UPLOAD_BYTES.labels(endpoint).inc(size)
+    STORAGE_UPLOAD_LATENCY.labels(endpoint).observe(seconds)
+
+
+def render_latest():
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
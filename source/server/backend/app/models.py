@@ -1,4 +1,4 @@
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, ForeignKey, Boolean
+from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, ForeignKey, Boolean, Float, LargeBinary, Index
 from sqlalchemy.orm import relationship, declarative_base
 from sqlalchemy.sql import func
 import datetime
@@ -17,7 +17,7 @@ class User(Base):
     is_active = Column(Boolean, default=True)
     created_at = Column(DateTime, server_default=func.now())
 
-    appeals = relationship("Appeal", back_populates="user")
+    appeals = relationship("Appeal", back_populates="user", foreign_keys="Appeal.user_id")
     messages = relationship("Message", back_populates="sender")
 
     def __repr__(self):
@@ -46,11 +46,19 @@ class AppealCategory(Base):
 
 class Appeal(Base):
     __tablename__ = "appeals"
+    __table_args__ = (
+        # Delta sync pages through changes in (updated_at, id) order.
+        Index("ix_appeals_updated_at_id", "updated_at", "id"),
+        # Appeal lists: a citizen's own appeals and the inspectors' queue, newest first.
+        Index("ix_appeals_user_id_created_at", "user_id", "created_at"),
+        Index("ix_appeals_created_at", "created_at"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     category_id = Column(Integer, ForeignKey("appeal_categories.id"), nullable=False)
     status_id = Column(Integer, ForeignKey("appeal_statuses.id"), nullable=False)
+    assignee_id = Column(Integer, ForeignKey("users.id"), nullable=True, index=True)
     address = Column(String, nullable=False)
     description = Column(Text)
     created_at = Column(DateTime, server_default=func.now())
@@ -59,7 +67,7 @@ class Appeal(Base):
     file_size = Column(Integer, nullable=True)
     file_type = Column(String, nullable=True)
 
-    user = relationship("User", back_populates="appeals")
+    user = relationship("User", back_populates="appeals", foreign_keys=[user_id])
     status = relationship("AppealStatus", back_populates="appeals")
     category = relationship("AppealCategory", back_populates="appeals")
     messages = relationship("Message", back_populates="appeal")
@@ -70,6 +78,8 @@ class Appeal(Base):
 
 class Message(Base):
     __tablename__ = "messages"
+    # A chat is read in id order.
+    __table_args__ = (Index("ix_messages_appeal_id_id", "appeal_id", "id"),)
 
     id = Column(Integer, primary_key=True, index=True)
     appeal_id = Column(Integer, ForeignKey("appeals.id"), nullable=False)
@@ -94,4 +104,124 @@ class DeviceToken(Base):
     device_type = Column(String, nullable=True)
     created_at = Column(DateTime, server_default=func.now())
 
-    user = relationship("User")
\ No newline at end of file
+    user = relationship("User")
+
+class RateLimitBucket(Base):
+    __tablename__ = "rate_limit_buckets"
+    key = Column(String, primary_key=True)
+    tokens = Column(Float, nullable=False)
+    allowed = Column(Boolean, nullable=False, default=True)
+    updated_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+
+class IdempotencyKey(Base):
+    __tablename__ = "idempotency_keys"
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    key = Column(String(255), primary_key=True)
+    fingerprint = Column(String(64), nullable=False)
+    status_code = Column(Integer, nullable=True)
+    response_body = Column(LargeBinary, nullable=True)
+    created_at = Column(DateTime, nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+class UploadSession(Base):
+    __tablename__ = "upload_sessions"
+    id = Column(String(36), primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    filename = Column(String, nullable=False)
+    content_type = Column(String, nullable=True)
+    total_size = Column(Integer, nullable=False)
+    chunk_size = Column(Integer, nullable=False)
+    s3_key = Column(String, nullable=False)
+    s3_upload_id = Column(String, nullable=True)
+    # open -> completing -> completed -> attached; open sessions left idle are aborted by gc-uploads.
+    status = Column(String, nullable=False, default="open")
+    created_at = Column(DateTime, server_default=func.now())
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now(), index=True)
+
+    parts = relationship("UploadPart", back_populates="session", cascade="all, delete-orphan")
+
+class UploadPart(Base):
+    __tablename__ = "upload_parts"
+    session_id = Column(String(36), ForeignKey("upload_sessions.id"), primary_key=True)
+    part_number = Column(Integer, primary_key=True)
+    size = Column(Integer, nullable=False)
+    etag = Column(String, nullable=False)
+
+    session = relationship("UploadSession", back_populates="parts")
+
+class PendingUpload(Base):
+    # An appeal or message whose attachments are still on their way to storage;
+    # the row itself is only inserted once they are stored.
+    __tablename__ = "pending_uploads"
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    endpoint = Column(String, nullable=False)
+    idempotency_key = Column(String(255), nullable=True)
+    created_at = Column(DateTime, server_default=func.now(), index=True)
+
+class StoredObject(Base):
+    __tablename__ = "stored_objects"
+    sha256 = Column(String(64), primary_key=True)
+    key = Column(String, nullable=False, unique=True)
+    size = Column(Integer, nullable=False)
+    ref_count = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, server_default=func.now())
+
+class AppealReadState(Base):
+    __tablename__ = "appeal_read_states"
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    appeal_id = Column(Integer, ForeignKey("appeals.id"), primary_key=True)
+    last_read_message_id = Column(Integer, nullable=False, default=0)
+    unread_count = Column(Integer, nullable=False, default=0)
+
+# Closed appeals older than ARCHIVE_AFTER_DAYS are moved here with their chat
+# history by `python -m app.manage archive-appeals`; ids are kept as they were.
+class ArchivedAppeal(Base):
+    __tablename__ = "archived_appeals"
+
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    category_id = Column(Integer, ForeignKey("appeal_categories.id"), nullable=False)
+    status_id = Column(Integer, ForeignKey("appeal_statuses.id"), nullable=False)
+    assignee_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+    address = Column(String, nullable=False)
+    description = Column(Text)
+    created_at = Column(DateTime)
+    updated_at = Column(DateTime)
+    file_paths = Column(Text, nullable=True)
+    file_size = Column(Integer, nullable=True)
+    file_type = Column(String, nullable=True)
+    archived_at = Column(DateTime, server_default=func.now())
+
+    user = relationship("User", foreign_keys=[user_id])
+    status = relationship("AppealStatus")
+    category = relationship("AppealCategory")
+    messages = relationship("ArchivedMessage", back_populates="appeal")
+
+    def __repr__(self):
+        return f"<ArchivedAppeal(id={self.id}, user_id={self.user_id}, address='{self.address}')>"
+
+class ArchivedMessage(Base):
+    __tablename__ = "archived_messages"
+    __table_args__ = (Index("ix_archived_messages_appeal_id_id", "appeal_id", "id"),)
+
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    appeal_id = Column(Integer, ForeignKey("archived_appeals.id"), nullable=False)
+    sender_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    content = Column(Text, nullable=False)
+    created_at = Column(DateTime)
+    file_paths = Column(Text, nullable=True)
+    file_size = Column(Integer, nullable=True)
+    file_type = Column(String, nullable=True)
+
+    appeal = relationship("ArchivedAppeal", back_populates="messages")
+    sender = relationship("User")
+
+class AppealTombstone(Base):
+    """An appeal that left the active list (archived), for GET /appeals/sync."""
+    __tablename__ = "appeal_tombstones"
+
+    id = Column(Integer, primary_key=True)
+    appeal_id = Column(Integer, nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    removed_at = Column(DateTime, server_default=func.now(), index=True)
@@ -0,0 +1,233 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.orm import Session
+
+from . import metrics, models
+from .database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+FIREBASE_CREDENTIALS_PATH = os.environ.get("FIREBASE_CREDENTIALS_PATH")
+# Chat pushes to the same recipient about the same appeal are merged while they
+# keep arriving less than NOTIFY_COALESCE_SECONDS apart, but never held back
+# longer than NOTIFY_MAX_DELAY_SECONDS. 0 disables coalescing.
+NOTIFY_COALESCE_SECONDS = float(os.environ.get("NOTIFY_COALESCE_SECONDS", "10"))
+NOTIFY_MAX_DELAY_SECONDS = float(os.environ.get("NOTIFY_MAX_DELAY_SECONDS", "30"))
+
+_firebase_ready: Optional[bool] = None
+_firebase_lock = threading.Lock()
+
+
+def init_firebase() -> bool:
+    """Initialize the Firebase Admin SDK on first use; later calls return the cached result."""
+    global _firebase_ready
+    if _firebase_ready is not None:
+        return _firebase_ready
+    with _firebase_lock:
+        if _firebase_ready is None:
+            _firebase_ready = _initialize_firebase_app()
+    return _firebase_ready
+
+
+def _initialize_firebase_app() -> bool:
+    if not (FIREBASE_CREDENTIALS_PATH and os.path.exists(FIREBASE_CREDENTIALS_PATH)):
+        logger.warning(
+            "Firebase credentials path not set or file not found (%s). Push notifications will not work.",
+            FIREBASE_CREDENTIALS_PATH,
+        )
+        return False
+
+    import firebase_admin
+    from firebase_admin import credentials
+
+    try:
+        with open(FIREBASE_CREDENTIALS_PATH, 'r') as f:
+            cred_data = json.load(f)
+            firebase_project_id = cred_data.get('project_id')
+            if not firebase_project_id:
+                logger.warning("Could not find 'project_id' in Firebase credentials file.")
+
+        cred = credentials.Certificate(FIREBASE_CREDENTIALS_PATH)
+
+        if not firebase_admin._apps:
+            init_options = {'projectId': firebase_project_id} if firebase_project_id else None
+            firebase_admin.initialize_app(cred, init_options)
+            logger.info("Firebase Admin SDK initialized successfully (Project ID: %s).", firebase_project_id)
+        else:
+            current_app = firebase_admin.get_app()
+            if firebase_project_id and current_app.project_id != firebase_project_id:
+                logger.warning(
+                    "Firebase Admin SDK already initialized with a different project ID (%s). Expected: %s",
+                    current_app.project_id, firebase_project_id,
+                )
+            else:
+                logger.info("Firebase Admin SDK already initialized.")
+        return True
+
+    except Exception as e:
+        logger.error("Error initializing Firebase Admin SDK: %s", e)
+        return False
+
+
+def fcm_tokens(db: Session, user_id: int) -> List[str]:
+    return [token for (token,) in db.query(models.DeviceToken.fcm_token).filter(models.DeviceToken.user_id == user_id)]
+
+
+def send_fcm_notification(user_id: int, title: str, body: str, db: Session, data: Optional[dict] = None):
+    if not init_firebase():
+         logger.debug("Firebase Admin SDK not initialized. Cannot send notification.")
+         return
+
+    from firebase_admin import exceptions, messaging
+
+    registration_tokens = fcm_tokens(db, user_id)
+
+    if not registration_tokens:
+        logger.debug("No FCM tokens found for user_id: %s", user_id)
+        return
+
+    logger.debug("Sending notifications to %d tokens for user_id %s", len(registration_tokens), user_id)
+
+    success_count = 0
+    failure_count = 0
+    failed_tokens = []
+
+    for token in registration_tokens:
+        message = messaging.Message(
+            notification=messaging.Notification(
+                title=title,
+                body=body,
+            ),
+            data=data if data else {},
+            token=token,
+        )
+        started = time.perf_counter()
+        try:
+            response = messaging.send(message)
+            logger.debug("Sent message to token %s: %s", token[-10:], response)
+            success_count += 1
+            metrics.FCM_SENDS.labels("success").inc()
+        except messaging.UnregisteredError:
+             logger.info("Token %s is unregistered. Consider removing from DB.", token[-10:])
+             failure_count += 1
+             failed_tokens.append(token)
+             metrics.FCM_SENDS.labels("unregistered").inc()
+        except exceptions.FirebaseError as e:
+             logger.warning("Firebase error sending to token %s: %s", token[-10:], e)
+             failure_count += 1
+             failed_tokens.append(token)
+             metrics.FCM_SENDS.labels("firebase_error").inc()
+             if hasattr(e, 'http_response'):
+                  logger.warning("HTTP Response Body: %s", e.http_response.text)
+        except Exception as e:
+             logger.error("General error sending to token %s: %s", token[-10:], e)
+             failure_count += 1
+             failed_tokens.append(token)
+             metrics.FCM_SENDS.labels("error").inc()
+        finally:
+            metrics.FCM_SEND_LATENCY.observe(time.perf_counter() - started)
+
+    logger.info(
+        "Finished sending notifications for user_id %s. Success: %d, Failures: %d",
+        user_id, success_count, failure_count,
+    )
+    if failure_count > 0:
+        logger.info("Failed tokens: %s", [t[-10:] for t in failed_tokens])
+
+
+def send_fcm_notification_in_new_session(user_id: int, title: str, body: str, data: Optional[dict] = None):
+    """For sends that outlive the request whose session would otherwise be used."""
+    db = SessionLocal()
+    try:
+        send_fcm_notification(user_id=user_id, title=title, body=body, db=db, data=data)
+    except Exception as e:
+        logger.error("Error sending FCM notification to user_id %s: %s", user_id, e, exc_info=True)
+    finally:
+        db.close()
+
+
+class _PendingPush:
+    __slots__ = ("title", "body", "summary", "data", "count", "first_held", "timer")
+
+    def __init__(self):
+        self.title = self.body = self.summary = None
+        self.data = None
+        self.count = 0
+        self.first_held = None
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+
+class NotificationCoalescer:
+    """Debounces chat pushes per (recipient, appeal).
+
+    The first push goes out immediately and opens a window. Pushes arriving
+    while it is open are held. When the conversation goes quiet for `window`
+    seconds, or `max_delay` after the first held push, they are sent as one
+    summary. Must be used from the event loop.
+    """
+
+    def __init__(self, window: float, max_delay: float):
+        self.window = window
+        self.max_delay = max_delay
+        self._pending: Dict[Tuple[int, int], _PendingPush] = {}
+        self._tasks: Set[asyncio.Task] = set()
+
+    def add(self, user_id: int, appeal_id: int, title: str, body: str, summary: Callable[[int], str],
+            data: Optional[dict] = None):
+        """Queue a push; when several are merged, `summary(count)` gives the body."""
+        if self.window <= 0:
+            self._spawn(user_id, title, body, data)
+            return
+
+        loop = asyncio.get_running_loop()
+        key = (user_id, appeal_id)
+        pending = self._pending.get(key)
+        if pending is None:
+            pending = self._pending[key] = _PendingPush()
+            pending.timer = loop.call_later(self.window, self._flush, key)
+            self._spawn(user_id, title, body, data)
+            return
+
+        now = loop.time()
+        if pending.count == 0:
+            pending.first_held = now
+        pending.count += 1
+        pending.title, pending.body, pending.summary, pending.data = title, body, summary, data
+        metrics.NOTIFICATIONS_COALESCED.inc()
+        pending.timer.cancel()
+        flush_at = min(now + self.window, pending.first_held + self.max_delay)
+        pending.timer = loop.call_at(flush_at, self._flush, key)
+
+    def _flush(self, key: Tuple[int, int]):
+        pending = self._pending.pop(key, None)
+        if pending is None or pending.count == 0:
+            return
+        body = pending.body if pending.count == 1 else pending.summary(pending.count)
+        self._spawn(key[0], pending.title, body, pending.data)
+
+    def _spawn(self, user_id: int, title: str, body: str, data: Optional[dict]):
+        # The token lookup and messaging.send() block, so the send runs on a worker thread.
+        task = asyncio.get_running_loop().create_task(
+            run_in_threadpool(send_fcm_notification_in_new_session, user_id, title, body, data)
+        )
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def drain(self):
+        """Send everything still held and wait for in-flight sends (on shutdown)."""
+        for key, pending in list(self._pending.items()):
+            if pending.timer is not None:
+                pending.timer.cancel()
+            self._flush(key)
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+
+chat_notifications = NotificationCoalescer(NOTIFY_COALESCE_SECONDS, NOTIFY_MAX_DELAY_SECONDS)
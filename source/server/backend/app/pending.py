@@ -0,0 +1,62 @@
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy.orm import Session
+
+from . import idempotency, models
+
+logger = logging.getLogger(__name__)
+
+# Appeals and messages with attachments are created in three steps: a
+# pending_uploads row is committed, the files go to object storage while no
+# database connection is held, and a second transaction inserts the appeal or
+# message, links the files and drops the pending row. The real row, and so its
+# id, only appears when it is complete: clients paging by id never skip one.
+
+PENDING_RECORD_TTL = timedelta(minutes=float(os.environ.get("PENDING_RECORD_TTL_MINUTES", "30")))
+
+
+def reserve(db: Session, user_id: int, endpoint: str, idempotency_key: Optional[str] = None) -> int:
+    """Record an in-flight upload in the caller's transaction; returns its id."""
+    pending_upload = models.PendingUpload(user_id=user_id, endpoint=endpoint, idempotency_key=idempotency_key)
+    db.add(pending_upload)
+    db.flush()
+    return pending_upload.id
+
+
+def finish(db: Session, pending_id: Optional[int]):
+    """Drop the reservation in the transaction that inserts the real row."""
+    if pending_id is not None:
+        db.query(models.PendingUpload).filter(models.PendingUpload.id == pending_id).delete(synchronize_session=False)
+
+
+def discard(db: Session, pending_id: int, user_id: int, idempotency_key: Optional[str] = None):
+    """Undo the first step after the upload or the finalization failed."""
+    try:
+        db.rollback()
+        finish(db, pending_id)
+        if idempotency_key:
+            idempotency.release(db, user_id, idempotency_key)
+        db.commit()
+    except Exception as e:
+        # cleanup-pending removes whatever is left here.
+        logger.error("Could not discard pending upload %s: %s", pending_id, e)
+        db.rollback()
+
+
+def cleanup(db: Session, older_than: timedelta = PENDING_RECORD_TTL) -> int:
+    """Drop reservations of requests that never finished, e.g. because the worker died.
+
+    Their unfinished Idempotency-Key claims are released so that retries run again.
+    """
+    stale = db.query(models.PendingUpload).filter(
+        models.PendingUpload.created_at < datetime.now() - older_than
+    ).all()
+    for pending_upload in stale:
+        if pending_upload.idempotency_key:
+            idempotency.release(db, pending_upload.user_id, pending_upload.idempotency_key)
+        db.delete(pending_upload)
+    db.commit()
+    return len(stale)
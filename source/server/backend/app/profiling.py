@@ -0,0 +1,95 @@
+import logging
+import os
+import re
+import time
+from collections import Counter
+from contextvars import ContextVar
+from typing import List, Optional, Tuple
+
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+# Everything here is opt-in: with SQL_PROFILING unset no engine listener or
+# middleware is installed, so the normal request path does no extra work.
+ENABLED = os.environ.get("SQL_PROFILING") == "1"
+SLOW_QUERY_MS = float(os.environ.get("SQL_SLOW_QUERY_MS", "100"))
+NPLUS1_THRESHOLD = int(os.environ.get("SQL_NPLUS1_THRESHOLD", "3"))
+SERVER_TIMING = os.environ.get("SQL_PROFILING_SERVER_TIMING") == "1"
+
+_whitespace = re.compile(r"\s+")
+
+
+class QueryProfile:
+    def __init__(self):
+        self.queries: List[Tuple[str, float]] = []
+
+    @property
+    def total_ms(self) -> float:
+        return sum(duration for _, duration in self.queries)
+
+    def repeated_shapes(self, threshold: int) -> List[Tuple[str, int]]:
+        counts = Counter(statement for statement, _ in self.queries)
+        return [(statement, count) for statement, count in counts.most_common() if count >= threshold]
+
+
+_current_profile: ContextVar[Optional[QueryProfile]] = ContextVar("sql_profile", default=None)
+
+
+def statement_shape(statement: str) -> str:
+    # SQLAlchemy already binds values as parameters, so only formatting differs
+    # between executions of the same query.
+    return _whitespace.sub(" ", statement).strip()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("profiling_query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    duration_ms = (time.perf_counter() - conn.info["profiling_query_start"].pop()) * 1000
+    shape = statement_shape(statement)
+    profile = _current_profile.get()
+    if profile is not None:
+        profile.queries.append((shape, duration_ms))
+    if duration_ms >= SLOW_QUERY_MS:
+        logger.warning("Slow query (%.1f ms): %s | params=%r", duration_ms, shape, parameters)
+
+
+def instrument_engine(engine):
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+class SQLProfilingMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        profile = QueryProfile()
+        token = _current_profile.set(profile)
+
+        async def send_wrapper(message):
+            if SERVER_TIMING and message["type"] == "http.response.start":
+                timing = f'db;dur={profile.total_ms:.1f};desc="{len(profile.queries)} queries"'
+                message["headers"] = list(message.get("headers", [])) + [(b"server-timing", timing.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current_profile.reset(token)
+            self._report(scope, profile)
+
+    def _report(self, scope, profile: QueryProfile):
+        route = scope.get("route")
+        route_name = f"{scope['method']} {route.path if route is not None else scope['path']}"
+        logger.info("%s: %d queries, %.1f ms in DB", route_name, len(profile.queries), profile.total_ms)
+        for statement, duration_ms in profile.queries:
+            logger.debug("  %.2f ms  %s", duration_ms, statement)
+        for statement, count in profile.repeated_shapes(NPLUS1_THRESHOLD):
+            logger.warning("Possible N+1 in %s: %d executions of %s", route_name, count, statement)
@@ -0,0 +1,138 @@
+import math
+import os
+import time
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import text
+
+# route name -> (requests, period in seconds); the bucket holds `requests` tokens
+# and refills at requests/period tokens per second.
+DEFAULT_RATE_LIMITS: Dict[str, Tuple[int, float]] = {
+    "read_messages": (60, 60),
+    "create_message": (30, 60),
+    "create_appeal": (10, 60),
+}
+
+
+def parse_rate_limits(value: Optional[str]) -> Dict[str, Tuple[int, float]]:
+    """Parse RATE_LIMITS, e.g. "read_messages=120/60,create_appeal=0" (0 disables a route)."""
+    limits = dict(DEFAULT_RATE_LIMITS)
+    if not value:
+        return limits
+    for item in value.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        name, _, spec = item.partition("=")
+        requests, _, period = spec.partition("/")
+        limits[name.strip()] = (int(requests), float(period or 1))
+    return limits
+
+
+class TokenBucket:
+    __slots__ = ("capacity", "rate", "tokens", "updated")
+
+    def __init__(self, capacity: float, rate: float, now: float):
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = capacity
+        self.updated = now
+
+    def consume(self, now: float) -> float:
+        """Take one token; return 0 on success or the seconds until a token is available."""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class InMemoryRateLimiter:
+    blocking = False
+
+    def __init__(self, max_keys: int = 10000):
+        self.max_keys = max_keys
+        self._buckets: Dict[str, TokenBucket] = {}
+
+    def hit(self, key: str, capacity: int, period: float) -> float:
+        now = time.monotonic()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if len(self._buckets) >= self.max_keys:
+                self._evict(now)
+            bucket = self._buckets[key] = TokenBucket(capacity, capacity / period, now)
+        return bucket.consume(now)
+
+    def _evict(self, now: float):
+        # Buckets that have refilled completely carry no state worth keeping.
+        full = [
+            key for key, bucket in self._buckets.items()
+            if bucket.tokens + (now - bucket.updated) * bucket.rate >= bucket.capacity
+        ]
+        for key in full:
+            del self._buckets[key]
+
+
+class PostgresRateLimiter:
+    """Token buckets shared by all workers, stored in the rate_limit_buckets table.
+
+    Refill and consumption happen in a single UPSERT, so concurrent requests from
+    different workers cannot both take the last token.
+    """
+    blocking = True
+
+    _hit_sql = text("""
+        INSERT INTO rate_limit_buckets AS b (key, tokens, allowed, updated_at)
+        VALUES (:key, :capacity - 1, TRUE, clock_timestamp())
+        ON CONFLICT (key) DO UPDATE SET
+            tokens = CASE
+                WHEN LEAST(:capacity, b.tokens + EXTRACT(EPOCH FROM clock_timestamp() - b.updated_at) * :rate) >= 1
+                THEN LEAST(:capacity, b.tokens + EXTRACT(EPOCH FROM clock_timestamp() - b.updated_at) * :rate) - 1
+                ELSE LEAST(:capacity, b.tokens + EXTRACT(EPOCH FROM clock_timestamp() - b.updated_at) * :rate)
+            END,
+            allowed = LEAST(:capacity, b.tokens + EXTRACT(EPOCH FROM clock_timestamp() - b.updated_at) * :rate) >= 1,
+            updated_at = clock_timestamp()
+        RETURNING allowed, tokens
+    """)
+
+    def __init__(self, get_engine):
+        self.get_engine = get_engine
+
+    def hit(self, key: str, capacity: int, period: float) -> float:
+        rate = capacity / period
+        with self.get_engine().begin() as connection:
+            allowed, tokens = connection.execute(
+                self._hit_sql, {"key": key, "capacity": capacity, "rate": rate}
+            ).one()
+        if allowed:
+            return 0.0
+        return (1 - tokens) / rate
+
+
+def create_rate_limiter(get_engine):
+    if os.environ.get("RATE_LIMIT_BACKEND", "memory") == "postgres":
+        return PostgresRateLimiter(get_engine)
+    return InMemoryRateLimiter()
+
+
+class ConcurrencyLimiter:
+    """Caps in-flight requests per worker; callers reject instead of queueing."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.in_flight = 0
+
+    def try_acquire(self) -> bool:
+        # Runs on the event loop, so check-and-increment cannot interleave.
+        if self.limit > 0 and self.in_flight >= self.limit:
+            return False
+        self.in_flight += 1
+        return True
+
+    def release(self):
+        self.in_flight -= 1
+
+
+def retry_after_header(seconds: float) -> Dict[str, str]:
+    return {"Retry-After": str(max(1, math.ceil(seconds)))}
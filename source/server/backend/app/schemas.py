@@ -1,4 +1,4 @@
-from typing import List, Optional, Union
+from typing import List, Literal, Optional, Union
 from pydantic import BaseModel, Field, EmailStr, validator
 from datetime import datetime
 
@@ -13,6 +13,13 @@ class UserBase(BaseModel):
     email: EmailStr = Field(..., example="john.doe@example.com")
     full_name: Optional[str] = Field(None, example="John Doe", max_length=100)
 
+def check_password_strength(v):
+    if not any(char.isdigit() for char in v):
+        raise ValueError('Password must contain at least one digit')
+    if not any(char.isupper() for char in v):
+        raise ValueError('Password must contain at least one uppercase letter')
+    return v
+
 class UserCreate(UserBase):
     password: str = Field(..., example="secret_password", min_length=8)
     password_confirm: str = Field(..., example="secret_password")
@@ -20,11 +27,7 @@ class UserCreate(UserBase):
 
     @validator("password")
     def password_strength(cls, v):
-        if not any(char.isdigit() for char in v):
-            raise ValueError('Password must contain at least one digit')
-        if not any(char.isupper() for char in v):
-            raise ValueError('Password must contain at least one uppercase letter')
-        return v
+        return check_password_strength(v)
 
     @validator("password_confirm")
     def passwords_match(cls, v, values, **kwargs):
@@ -32,6 +35,14 @@ class UserCreate(UserBase):
             raise ValueError('Passwords do not match')
         return v
 
+class UserImportRow(UserBase):
+    password: str = Field(..., min_length=8)
+    role: Literal["citizen", "inspector"] = "citizen"
+
+    @validator("password")
+    def password_strength(cls, v):
+        return check_password_strength(v)
+
 class User(UserBase):
     id: int
     is_active: bool
@@ -88,6 +99,7 @@ class Appeal(AppealBase):
     created_at: datetime
     updated_at: datetime
     file_paths: Optional[List[str]] = None
+    assignee_id: Optional[int] = None
     user: User
     status: AppealStatus
     category: AppealCategory
@@ -118,4 +130,33 @@ class Message(MessageBase):
 # --- Device Token ---
 class DeviceTokenCreate(BaseModel):
     fcm_token: str
-    device_type: Optional[str] = None
\ No newline at end of file
+    device_type: Optional[str] = None
+
+class UploadSessionCreate(BaseModel):
+    filename: str = Field(..., min_length=1, max_length=255, example="plan.pdf")
+    size: int = Field(..., gt=0, example=12582912)
+    content_type: Optional[str] = Field(None, example="application/pdf")
+
+class AppealFields(BaseModel):
+    """An appeal from an endpoint taking `fields` and `include`: attributes that were not selected are left out."""
+    id: int
+    address: Optional[str] = None
+    description: Optional[str] = None
+    category_id: Optional[int] = None
+    user_id: Optional[int] = None
+    status_id: Optional[int] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+    file_paths: Optional[List[str]] = None
+    assignee_id: Optional[int] = None
+    user: Optional[User] = None
+    status: Optional[AppealStatus] = None
+    category: Optional[AppealCategory] = None
+    messages: Optional[List[Message]] = None
+
+class AppealSync(BaseModel):
+    appeals: List[AppealFields]
+    removed: List[int]
+    sync_token: str
+    has_more: bool
+    reset: bool
@@ -0,0 +1,95 @@
+import json
+from typing import Dict, List, Optional
+
+from . import models
+
+APPEAL_FIELDS = (
+    "id", "address", "description", "category_id", "user_id",
+    "status_id", "created_at", "updated_at", "file_paths", "assignee_id",
+)
+APPEAL_INCLUDES = ("user", "status", "category", "messages")
+DEFAULT_APPEAL_INCLUDE = ("user", "status", "category")
+
+
+def decode_file_paths(raw) -> List[str]:
+    if not raw:
+        return []
+    if isinstance(raw, list):
+        return [str(item) for item in raw]
+    try:
+        decoded = json.loads(raw)
+    except (json.JSONDecodeError, TypeError):
+        return []
+    if not isinstance(decoded, list):
+        return []
+    return [str(item) for item in decoded]
+
+
+def user_to_dict(user: models.User) -> dict:
+    return {
+        "id": user.id,
+        "username": user.username,
+        "email": user.email,
+        "full_name": user.full_name,
+        "is_active": user.is_active,
+        "created_at": user.created_at,
+        "role": user.role,
+    }
+
+
+def _cached_user(user: models.User, users_cache: Optional[Dict[int, dict]]) -> dict:
+    if users_cache is None:
+        return user_to_dict(user)
+    cached = users_cache.get(user.id)
+    if cached is None:
+        cached = users_cache[user.id] = user_to_dict(user)
+    return cached
+
+
+def message_to_dict(message: models.Message, users_cache: Optional[Dict[int, dict]] = None) -> dict:
+    return {
+        "id": message.id,
+        "appeal_id": message.appeal_id,
+        "sender_id": message.sender_id,
+        "content": message.content,
+        "created_at": message.created_at,
+        "file_paths": decode_file_paths(message.file_paths) if message.file_paths else None,
+        "sender": _cached_user(message.sender, users_cache),
+    }
+
+
+def messages_to_list(messages: List[models.Message], users_cache: Optional[Dict[int, dict]] = None) -> List[dict]:
+    if users_cache is None:
+        users_cache = {}
+    return [message_to_dict(message, users_cache) for message in messages]
+
+
+def appeal_to_dict(
+    appeal: models.Appeal,
+    users_cache: Optional[Dict[int, dict]] = None,
+    fields=APPEAL_FIELDS,
+    include=DEFAULT_APPEAL_INCLUDE,
+) -> dict:
+    # Only the requested attributes are touched: with load_only() any other
+    # column access would trigger a lazy load per row.
+    data = {}
+    for field in fields:
+        if field == "file_paths":
+            data[field] = decode_file_paths(appeal.file_paths)
+        else:
+            data[field] = getattr(appeal, field)
+    if "user" in include:
+        data["user"] = _cached_user(appeal.user, users_cache)
+    if "status" in include:
+        data["status"] = {"id": appeal.status.id, "name": appeal.status.name}
+    if "category" in include:
+        data["category"] = {"id": appeal.category.id, "name": appeal.category.name}
+    if "messages" in include:
+        messages = sorted(appeal.messages, key=lambda message: message.id)
+        data["messages"] = messages_to_list(messages, users_cache)
+    return data
+
+
+def appeals_to_list(appeals: List[models.Appeal], fields=APPEAL_FIELDS, include=DEFAULT_APPEAL_INCLUDE) -> List[dict]:
+    users_cache: Dict[int, dict] = {}
+    return [appeal_to_dict(appeal, users_cache, fields, include) for appeal in appeals]
@@ -0,0 +1,285 @@
+import hashlib
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone
+from typing import Iterator, List, Optional, Tuple
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+# STORAGE_BACKEND picks where attachments live: "s3" (Yandex Object Storage or
+# any S3-compatible service) or "local" (a directory served by GET /files/...).
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "s3")
+# Earlier public base URLs, so that stored attachment URLs still map to keys
+# after STORAGE_PUBLIC_URL changes (comma-separated).
+STORAGE_LEGACY_URLS = tuple(url.rstrip("/") for url in os.environ.get("STORAGE_LEGACY_URLS", "").split(",") if url)
+LIST_PAGE_SIZE = 1000
+
+_s3_client = None
+_s3_client_lock = threading.Lock()
+_storage = None
+
+
+def get_s3_client():
+    # boto3 clients are thread-safe; building one per request costs more than most uploads.
+    global _s3_client
+    if _s3_client is None:
+        with _s3_client_lock:
+            if _s3_client is None:
+                import boto3
+
+                session = boto3.session.Session()
+                _s3_client = session.client(
+                    service_name='s3',
+                    endpoint_url=os.environ.get("YC_ENDPOINT_URL"),
+                    aws_access_key_id=os.environ.get("YC_AWS_ACCESS_KEY_ID"),
+                    aws_secret_access_key=os.environ.get("YC_AWS_SECRET_ACCESS_KEY"),
+                )
+    return _s3_client
+
+
+class Storage(ABC):
+    """Public attachment storage addressed by key.
+
+    Listing pages hold dicts with Key, Size and LastModified (aware UTC), as
+    in an S3 listing. Multipart uploads back the resumable upload sessions.
+    """
+
+    def save(self, fileobj, key: str, endpoint: str, content_type: Optional[str] = None):
+        fileobj.seek(0, os.SEEK_END)
+        size = fileobj.tell()
+        fileobj.seek(0)
+        started = time.perf_counter()
+        try:
+            self._write(fileobj, key, content_type)
+        except Exception:
+            metrics.STORAGE_UPLOAD_FAILURES.labels(endpoint).inc()
+            raise
+        metrics.observe_upload(endpoint, size, time.perf_counter() - started)
+
+    @abstractmethod
+    def _write(self, fileobj, key: str, content_type: Optional[str]):
+        ...
+
+    legacy_base_urls: Tuple[str, ...] = ()
+
+    def url(self, key: str) -> str:
+        return f"{self.base_url}/{key}"
+
+    def key_from_url(self, url: str) -> Optional[str]:
+        for base_url in (self.base_url,) + self.legacy_base_urls:
+            prefix = base_url + "/"
+            if url.startswith(prefix):
+                return url[len(prefix):]
+        return None
+
+    @abstractmethod
+    def list_pages(self, prefix: str = "") -> Iterator[List[dict]]:
+        ...
+
+    @abstractmethod
+    def delete_many(self, keys: List[str]) -> List[str]:
+        """Delete the keys; returns the ones that could not be deleted."""
+
+    @abstractmethod
+    def start_multipart(self, key: str, content_type: Optional[str]) -> str:
+        ...
+
+    @abstractmethod
+    def upload_part(self, key: str, upload_id: str, part_number: int, data: bytes) -> str:
+        ...
+
+    @abstractmethod
+    def complete_multipart(self, key: str, upload_id: str, parts: List[Tuple[int, str]]):
+        ...
+
+    @abstractmethod
+    def abort_multipart(self, key: str, upload_id: str):
+        ...
+
+
+class S3Storage(Storage):
+    def __init__(self, bucket_name: str, base_url: Optional[str] = None, legacy_base_urls: Tuple[str, ...] = ()):
+        self.bucket_name = bucket_name
+        bucket_url = f"https://storage.yandexcloud.net/{bucket_name}"
+        self.base_url = (base_url or bucket_url).rstrip("/")
+        # Attachments saved before a custom base URL was set point at the bucket itself.
+        self.legacy_base_urls = tuple(dict.fromkeys(
+            url for url in (bucket_url,) + tuple(legacy_base_urls) if url != self.base_url
+        ))
+
+    @property
+    def client(self):
+        return get_s3_client()
+
+    def _write(self, fileobj, key, content_type):
+        extra_args = {'ACL': 'public-read'}
+        if content_type:
+            extra_args['ContentType'] = content_type
+        self.client.upload_fileobj(Fileobj=fileobj, Bucket=self.bucket_name, Key=key, ExtraArgs=extra_args)
+
+    def list_pages(self, prefix=""):
+        params = {"Bucket": self.bucket_name, "Prefix": prefix, "MaxKeys": LIST_PAGE_SIZE}
+        while True:
+            page = self.client.list_objects_v2(**params)
+            yield page.get("Contents", [])
+            if not page.get("IsTruncated"):
+                return
+            params["ContinuationToken"] = page["NextContinuationToken"]
+
+    def delete_many(self, keys):
+        response = self.client.delete_objects(
+            Bucket=self.bucket_name, Delete={"Objects": [{"Key": key} for key in keys], "Quiet": True}
+        )
+        for error in response.get("Errors", []):
+            logger.warning("Could not delete %s: %s %s", error["Key"], error.get("Code"), error.get("Message"))
+        return [error["Key"] for error in response.get("Errors", [])]
+
+    def start_multipart(self, key, content_type):
+        return self.client.create_multipart_upload(
+            Bucket=self.bucket_name, Key=key, ACL="public-read", ContentType=content_type or "application/octet-stream",
+        )["UploadId"]
+
+    def upload_part(self, key, upload_id, part_number, data):
+        return self.client.upload_part(
+            Bucket=self.bucket_name, Key=key, UploadId=upload_id, PartNumber=part_number, Body=data,
+        )["ETag"]
+
+    def complete_multipart(self, key, upload_id, parts):
+        self.client.complete_multipart_upload(
+            Bucket=self.bucket_name, Key=key, UploadId=upload_id,
+            MultipartUpload={"Parts": [{"ETag": etag, "PartNumber": number} for number, etag in parts]},
+        )
+
+    def abort_multipart(self, key, upload_id):
+        self.client.abort_multipart_upload(Bucket=self.bucket_name, Key=key, UploadId=upload_id)
+
+
+class LocalStorage(Storage):
+    """Files under `root`, served by the API itself; parts of multipart uploads wait in root/.multipart."""
+
+    MULTIPART_DIR = ".multipart"
+    # Files being written by _replace(): <name>.<uuid4 hex>.tmp
+    TEMPORARY_NAME = re.compile(r"\.[0-9a-f]{32}\.tmp$")
+
+    def __init__(self, root: str, base_url: str = "/files", legacy_base_urls: Tuple[str, ...] = ()):
+        self.root = os.path.abspath(root)
+        self.base_url = base_url.rstrip("/")
+        self.legacy_base_urls = tuple(legacy_base_urls)
+
+    def path(self, key: str) -> str:
+        path = os.path.abspath(os.path.join(self.root, key))
+        # Checked on the resolved path: "a/../.multipart/..." must not reach the parts either.
+        if (
+            not path.startswith(self.root + os.sep)
+            or os.path.relpath(path, self.root).split(os.sep, 1)[0] == self.MULTIPART_DIR
+            or self.TEMPORARY_NAME.search(path)
+        ):
+            raise ValueError(f"Invalid storage key: {key!r}")
+        return path
+
+    def _replace(self, key: str, write):
+        # Readers never see a half-written file: write aside, then rename.
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            with open(temporary, "wb") as target:
+                write(target)
+            os.replace(temporary, path)
+        except BaseException:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+            raise
+
+    def _write(self, fileobj, key, content_type):
+        self._replace(key, lambda target: shutil.copyfileobj(fileobj, target))
+
+    def list_pages(self, prefix=""):
+        page = []
+        for directory, subdirectories, filenames in os.walk(self.root):
+            if directory == self.root:
+                subdirectories[:] = [name for name in subdirectories if name != self.MULTIPART_DIR]
+            subdirectories.sort()
+            for filename in sorted(filenames):
+                path = os.path.join(directory, filename)
+                key = os.path.relpath(path, self.root).replace(os.sep, "/")
+                if not key.startswith(prefix) or self.TEMPORARY_NAME.search(filename):
+                    continue
+                stat_result = os.stat(path)
+                page.append({
+                    "Key": key,
+                    "Size": stat_result.st_size,
+                    "LastModified": datetime.fromtimestamp(stat_result.st_mtime, timezone.utc),
+                })
+                if len(page) == LIST_PAGE_SIZE:
+                    yield page
+                    page = []
+        yield page
+
+    def delete_many(self, keys):
+        failed = []
+        for key in keys:
+            try:
+                os.remove(self.path(key))
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning("Could not delete %s: %s", key, e)
+                failed.append(key)
+        return failed
+
+    def _parts_dir(self, upload_id: str) -> str:
+        if not upload_id.isalnum():
+            raise ValueError(f"Invalid upload id: {upload_id!r}")
+        return os.path.join(self.root, self.MULTIPART_DIR, upload_id)
+
+    def start_multipart(self, key, content_type):
+        upload_id = uuid.uuid4().hex
+        os.makedirs(self._parts_dir(upload_id))
+        return upload_id
+
+    def upload_part(self, key, upload_id, part_number, data):
+        part_path = os.path.join(self._parts_dir(upload_id), str(part_number))
+        with open(part_path + ".tmp", "wb") as part:
+            part.write(data)
+        os.replace(part_path + ".tmp", part_path)
+        return f'"{hashlib.md5(data).hexdigest()}"'
+
+    def complete_multipart(self, key, upload_id, parts):
+        parts_dir = self._parts_dir(upload_id)
+
+        def concatenate(target):
+            for number, _ in sorted(parts):
+                with open(os.path.join(parts_dir, str(number)), "rb") as part:
+                    shutil.copyfileobj(part, target)
+
+        self._replace(key, concatenate)
+        shutil.rmtree(parts_dir, ignore_errors=True)
+
+    def abort_multipart(self, key, upload_id):
+        shutil.rmtree(self._parts_dir(upload_id), ignore_errors=True)
+
+
+def get_storage() -> Storage:
+    global _storage
+    if _storage is None:
+        if STORAGE_BACKEND == "local":
+            _storage = LocalStorage(
+                os.environ.get("STORAGE_LOCAL_ROOT", "uploads"), os.environ.get("STORAGE_PUBLIC_URL") or "/files",
+                STORAGE_LEGACY_URLS,
+            )
+        elif STORAGE_BACKEND == "s3":
+            _storage = S3Storage(
+                os.environ.get("YC_BUCKET_NAME"), os.environ.get("STORAGE_PUBLIC_URL"), STORAGE_LEGACY_URLS
+            )
+        else:
+            raise ValueError(f"Unknown STORAGE_BACKEND {STORAGE_BACKEND!r}; expected s3 or local")
+    return _storage
@@ -0,0 +1,126 @@
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from typing import List
+
+from sqlalchemy import select
+
+from . import metrics, models, serializers
+from .database import get_engine
+from .storage import Storage
+
+logger = logging.getLogger(__name__)
+
+# Objects nothing refers to: uploads of requests that failed half-way, appeals
+# whose first file went up before the second one failed, and so on. A key is
+# in use when a row's file_paths links to it, when stored_objects tracks it,
+# or when a finished resumable upload owns it.
+
+STORAGE_GC_GRACE = timedelta(hours=float(os.environ.get("STORAGE_GC_GRACE_HOURS", "24")))
+STORAGE_GC_KEEP_PREFIXES = tuple(
+    prefix for prefix in os.environ.get("STORAGE_GC_KEEP_PREFIXES", "knowledge_base/").split(",") if prefix
+)
+DELETE_BATCH_SIZE = 1000  # the delete_objects limit
+_FILE_PATH_TABLES = (models.Appeal, models.Message, models.ArchivedAppeal, models.ArchivedMessage)
+
+
+UNMAPPED_SAMPLE_SIZE = 10
+
+
+class UnmappedUrlsError(RuntimeError):
+    """Stored file URLs do not map to keys, so the referenced set is incomplete."""
+
+    def __init__(self, count: int, sample: List[str]):
+        super().__init__(
+            f"{count} stored file URLs do not map to storage keys (e.g. {', '.join(sample)}); "
+            "nothing was deleted. List earlier public URLs in STORAGE_LEGACY_URLS."
+        )
+        self.count = count
+        self.sample = sample
+
+
+def referenced_keys(storage: Storage) -> set:
+    """Keys in use; raises UnmappedUrlsError if any stored URL cannot be mapped to a key."""
+    keys = set()
+    unmapped = 0
+    sample: List[str] = []
+    with get_engine().connect() as connection:
+        streaming = connection.execution_options(stream_results=True, yield_per=5000)
+        for model in _FILE_PATH_TABLES:
+            rows = streaming.execute(select(model.file_paths).where(model.file_paths.isnot(None)))
+            for raw, in rows:
+                for url in serializers.decode_file_paths(raw):
+                    key = storage.key_from_url(url)
+                    if key is not None:
+                        keys.add(key)
+                        continue
+                    unmapped += 1
+                    if len(sample) < UNMAPPED_SAMPLE_SIZE:
+                        sample.append(url)
+        if unmapped:
+            # Their objects would look like orphans and be deleted.
+            raise UnmappedUrlsError(unmapped, sample)
+        keys.update(connection.execute(select(models.StoredObject.key)).scalars())
+        keys.update(connection.execute(
+            select(models.UploadSession.s3_key).where(models.UploadSession.status != "open")
+        ).scalars())
+    return keys
+
+
+def _still_unreferenced(keys: List[str]) -> List[str]:
+    # Content-addressed keys can be registered again while the collector runs.
+    with get_engine().connect() as connection:
+        registered = set(connection.execute(
+            select(models.StoredObject.key).where(models.StoredObject.key.in_(keys))
+        ).scalars())
+    return [key for key in keys if key not in registered]
+
+
+def _delete(storage: Storage, batch: List[dict]) -> int:
+    keys = set(_still_unreferenced([item["Key"] for item in batch]))
+    batch = [item for item in batch if item["Key"] in keys]
+    if not batch:
+        return 0
+    failed = set(storage.delete_many([item["Key"] for item in batch]))
+    deleted = [item for item in batch if item["Key"] not in failed]
+    metrics.STORAGE_GC_DELETED.inc(len(deleted))
+    metrics.STORAGE_GC_DELETED_BYTES.inc(sum(item.get("Size", 0) for item in deleted))
+    return len(deleted)
+
+
+def collect_orphans(storage: Storage, grace: timedelta = STORAGE_GC_GRACE,
+                    dry_run: bool = False, prefix: str = "") -> dict:
+    """Delete bucket objects that no row refers to and that are older than `grace`.
+
+    The listing is streamed page by page; only the referenced keys are kept in
+    memory. With dry_run the orphans are counted and logged but kept. Nothing
+    is scanned when a stored URL cannot be mapped to a key (UnmappedUrlsError).
+    """
+    referenced = referenced_keys(storage)
+    logger.info("Loaded %d referenced keys", len(referenced))
+    cutoff = datetime.now(timezone.utc) - grace
+    stats = {"scanned": 0, "orphans": 0, "orphan_bytes": 0, "deleted": 0}
+    batch: List[dict] = []
+    for page in storage.list_pages(prefix):
+        stats["scanned"] += len(page)
+        metrics.STORAGE_GC_SCANNED.inc(len(page))
+        for item in page:
+            key = item["Key"]
+            if key.endswith("/") or key in referenced or key.startswith(STORAGE_GC_KEEP_PREFIXES):
+                continue
+            if item["LastModified"] > cutoff:
+                continue
+            stats["orphans"] += 1
+            stats["orphan_bytes"] += item.get("Size", 0)
+            metrics.STORAGE_GC_ORPHANS.labels(str(dry_run).lower()).inc()
+            if dry_run:
+                logger.info("Orphan: %s (%d bytes, %s)", key, item.get("Size", 0), item["LastModified"])
+                continue
+            batch.append(item)
+            if len(batch) == DELETE_BATCH_SIZE:
+                stats["deleted"] += _delete(storage, batch)
+                batch = []
+        logger.info("Scanned %d objects, %d orphans, %d deleted", stats["scanned"], stats["orphans"], stats["deleted"])
+    if batch:
+        stats["deleted"] += _delete(storage, batch)
+    return stats
@@ -0,0 +1,99 @@
+import base64
+import json
+import os
+from datetime import datetime, timedelta
+from typing import List, NamedTuple, Optional
+
+from fastapi import HTTPException
+from sqlalchemy import DateTime, func, select, tuple_
+from sqlalchemy.orm import Session
+
+from . import models
+
+# A sync token remembers where the client's copy of the appeal list stands:
+# `since` is when its previous full pass ended (tombstones newer than that are
+# reported) and (cursor_at, cursor_id) is the keyset position in the
+# (updated_at, id) order of the pass in progress.
+#
+# updated_at is taken at transaction start, so a row may become visible with a
+# timestamp slightly in the past. Finished passes therefore restart
+# SYNC_OVERLAP_SECONDS back; it must exceed the longest write transaction plus
+# replica lag. Clients upsert by id, so the overlap only costs a few repeats.
+
+SYNC_OVERLAP = timedelta(seconds=float(os.environ.get("APPEAL_SYNC_OVERLAP_SECONDS", "30")))
+TOMBSTONE_RETENTION = timedelta(days=float(os.environ.get("APPEAL_TOMBSTONE_RETENTION_DAYS", "30")))
+
+
+class SyncToken(NamedTuple):
+    since: datetime
+    cursor_at: Optional[datetime]
+    cursor_id: int
+
+
+class SyncPage(NamedTuple):
+    appeals: List[models.Appeal]
+    removed: List[int]
+    token: SyncToken
+    has_more: bool
+    reset: bool
+
+
+def encode_token(token: SyncToken) -> str:
+    payload = [token.since.isoformat(), token.cursor_at.isoformat() if token.cursor_at else None, token.cursor_id]
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip("=")
+
+
+def decode_token(value: str) -> SyncToken:
+    try:
+        since, cursor_at, cursor_id = json.loads(base64.urlsafe_b64decode(value + "=" * (-len(value) % 4)))
+        return SyncToken(
+            datetime.fromisoformat(since), datetime.fromisoformat(cursor_at) if cursor_at else None, int(cursor_id)
+        )
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid sync token")
+
+
+def changes(db: Session, user: models.User, token: Optional[str], limit: int, load_options) -> SyncPage:
+    """One page of appeals changed since `token`, plus ids removed since the last finished pass.
+
+    Without a token, or with one older than the tombstone retention, the pass
+    starts from scratch and `reset` tells the client to drop its copy.
+    """
+    now = db.execute(select(func.now(type_=DateTime))).scalar()
+    state = decode_token(token) if token else None
+    reset = state is None or state.since < now - TOMBSTONE_RETENTION
+    if reset:
+        state = SyncToken(now - SYNC_OVERLAP, None, 0)
+
+    query = db.query(models.Appeal).options(*load_options)
+    if user.role == "citizen":
+        query = query.filter(models.Appeal.user_id == user.id)
+    elif user.role != "inspector":
+        raise HTTPException(status_code=403, detail="Not enough permissions")
+    if state.cursor_at is not None:
+        query = query.filter(
+            tuple_(models.Appeal.updated_at, models.Appeal.id) > tuple_(state.cursor_at, state.cursor_id)
+        )
+    appeals = query.order_by(models.Appeal.updated_at, models.Appeal.id).limit(limit + 1).all()
+
+    if len(appeals) > limit:
+        appeals = appeals[:limit]
+        last = appeals[-1]
+        return SyncPage(appeals, [], SyncToken(state.since, last.updated_at, last.id), True, reset)
+
+    removed = []
+    if not reset:
+        tombstones = select(models.AppealTombstone.appeal_id).where(models.AppealTombstone.removed_at > state.since)
+        if user.role == "citizen":
+            tombstones = tombstones.where(models.AppealTombstone.user_id == user.id)
+        removed = sorted(set(db.execute(tombstones).scalars()))
+    restart = now - SYNC_OVERLAP
+    return SyncPage(appeals, removed, SyncToken(restart, restart, 0), False, reset)
+
+
+def purge_tombstones(db: Session, older_than: timedelta = TOMBSTONE_RETENTION) -> int:
+    deleted = db.query(models.AppealTombstone).filter(
+        models.AppealTombstone.removed_at < datetime.now() - older_than
+    ).delete(synchronize_session=False)
+    db.commit()
+    return deleted
@@ -0,0 +1,109 @@
+from typing import List, Optional
+
+from sqlalchemy import select, text
+from sqlalchemy.orm import Session
+
+from . import models
+
+# Read cursors live in appeal_read_states, one row per (user, appeal). The
+# appeal owner always has a row, and so does the assigned inspector; other
+# inspectors get one the first time they read or write in the chat. Counters are maintained by create_message in the same
+# transaction as the message, so GET /users/me/unread never counts messages.
+
+_increment_others_sql = text("""
+    UPDATE appeal_read_states SET unread_count = unread_count + 1
+    WHERE appeal_id = :appeal_id AND user_id != :sender_id
+""")
+
+_ensure_state_sql = text("""
+    INSERT INTO appeal_read_states (user_id, appeal_id, last_read_message_id, unread_count)
+    VALUES (:user_id, :appeal_id, 0, :unread_count)
+    ON CONFLICT (user_id, appeal_id) DO NOTHING
+""")
+
+_advance_cursor_sql = text("""
+    INSERT INTO appeal_read_states AS s (user_id, appeal_id, last_read_message_id, unread_count)
+    VALUES (:user_id, :appeal_id, :message_id, :unread_count)
+    ON CONFLICT (user_id, appeal_id) DO UPDATE SET
+        last_read_message_id = CASE
+            WHEN excluded.last_read_message_id > s.last_read_message_id THEN excluded.last_read_message_id
+            ELSE s.last_read_message_id
+        END,
+        unread_count = excluded.unread_count
+""")
+
+_set_cursor_sql = text("""
+    UPDATE appeal_read_states SET last_read_message_id = :message_id, unread_count = :unread_count
+    WHERE user_id = :user_id AND appeal_id = :appeal_id
+""")
+
+_unread_after_sql = text("""
+    SELECT COUNT(*) FROM messages
+    WHERE appeal_id = :appeal_id AND id > :message_id AND sender_id != :user_id
+""")
+
+_unread_counts_sql = text("""
+    SELECT appeal_id, unread_count, last_read_message_id FROM appeal_read_states
+    WHERE user_id = :user_id
+    ORDER BY appeal_id
+""")
+
+
+def track_appeal(db: Session, appeal_id: int, owner_id: int):
+    db.execute(_ensure_state_sql, {"user_id": owner_id, "appeal_id": appeal_id, "unread_count": 0})
+
+
+def track_assignee(db: Session, appeal_id: int, assignee_id: int):
+    """Give the newly assigned inspector a row; what others wrote so far counts as unread."""
+    unread_count = db.execute(
+        _unread_after_sql, {"appeal_id": appeal_id, "message_id": 0, "user_id": assignee_id}
+    ).scalar()
+    db.execute(_ensure_state_sql, {"user_id": assignee_id, "appeal_id": appeal_id, "unread_count": unread_count})
+
+
+def record_message(db: Session, appeal_id: int, owner_id: int, sender_id: int, message_id: int):
+    """Bump everyone else's counter and move the sender's cursor past their own message."""
+    db.execute(_increment_others_sql, {"appeal_id": appeal_id, "sender_id": sender_id})
+    if owner_id != sender_id:
+        # No-op when the owner already had a row: the UPDATE above counted it.
+        db.execute(_ensure_state_sql, {"user_id": owner_id, "appeal_id": appeal_id, "unread_count": 1})
+    db.execute(_advance_cursor_sql, {
+        "user_id": sender_id, "appeal_id": appeal_id, "message_id": message_id, "unread_count": 0,
+    })
+
+
+def mark_read(db: Session, user_id: int, appeal_id: int, message_id: Optional[int] = None) -> dict:
+    """Advance the user's cursor to message_id (default: the latest message); it never moves back.
+
+    message_id is capped at the appeal's latest message, so a made-up id cannot
+    mark future messages read. The read state row is locked before the
+    recount: an increment from a concurrent create_message either commits
+    first and is counted, or waits until the new counter is written.
+    """
+    latest = db.execute(
+        text("SELECT COALESCE(MAX(id), 0) FROM messages WHERE appeal_id = :appeal_id"),
+        {"appeal_id": appeal_id},
+    ).scalar()
+    message_id = latest if message_id is None else min(message_id, latest)
+    db.execute(_ensure_state_sql, {"user_id": user_id, "appeal_id": appeal_id, "unread_count": 0})
+    current = db.execute(
+        select(models.AppealReadState.last_read_message_id)
+        .where(models.AppealReadState.user_id == user_id, models.AppealReadState.appeal_id == appeal_id)
+        .with_for_update()
+    ).scalar()
+    cursor = max(message_id, current)
+    unread_count = db.execute(
+        _unread_after_sql, {"appeal_id": appeal_id, "message_id": cursor, "user_id": user_id}
+    ).scalar()
+    db.execute(_set_cursor_sql, {
+        "user_id": user_id, "appeal_id": appeal_id, "message_id": cursor, "unread_count": unread_count,
+    })
+    return {"appeal_id": appeal_id, "last_read_message_id": cursor, "unread_count": unread_count}
+
+
+def unread_counts(db: Session, user_id: int) -> List[dict]:
+    rows = db.execute(_unread_counts_sql, {"user_id": user_id})
+    return [
+        {"appeal_id": appeal_id, "unread_count": unread_count, "last_read_message_id": last_read}
+        for appeal_id, unread_count, last_read in rows
+    ]
@@ -0,0 +1,188 @@
+import logging
+import math
+import os
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import List
+
+from fastapi import HTTPException, Request
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import func
+
+from . import metrics, models
+from .storage import Storage
+
+logger = logging.getLogger(__name__)
+
+# S3 rejects multipart parts under 5 MiB except the last one.
+UPLOAD_CHUNK_SIZE = int(os.environ.get("UPLOAD_CHUNK_SIZE", str(5 * 1024 * 1024)))
+UPLOAD_MAX_SIZE = int(os.environ.get("UPLOAD_MAX_SIZE", str(200 * 1024 * 1024)))
+UPLOAD_SESSION_TTL = timedelta(hours=float(os.environ.get("UPLOAD_SESSION_TTL_HOURS", "24")))
+# A "completing" session older than this is taken to belong to a request that died.
+UPLOAD_COMPLETE_TIMEOUT = timedelta(minutes=5)
+
+
+def expected_parts(upload: models.UploadSession) -> int:
+    return math.ceil(upload.total_size / upload.chunk_size)
+
+
+def describe(upload: models.UploadSession, storage: Storage) -> dict:
+    received = sorted(part.part_number for part in upload.parts)
+    missing = sorted(set(range(1, expected_parts(upload) + 1)) - set(received))
+    return {
+        "upload_id": upload.id,
+        "filename": upload.filename,
+        "status": upload.status,
+        "total_size": upload.total_size,
+        "chunk_size": upload.chunk_size,
+        "received_bytes": sum(part.size for part in upload.parts),
+        "received_offsets": [(number - 1) * upload.chunk_size for number in received],
+        "missing_offsets": [(number - 1) * upload.chunk_size for number in missing],
+        "url": storage.url(upload.s3_key) if upload.status in ("completed", "attached") else None,
+    }
+
+
+def get_owned(db: Session, upload_id: str, user_id: int, lock: bool = False) -> models.UploadSession:
+    query = db.query(models.UploadSession).filter(models.UploadSession.id == upload_id)
+    if lock:
+        query = query.with_for_update()
+    upload = query.first()
+    if upload is None or upload.user_id != user_id:
+        raise HTTPException(status_code=404, detail="Upload session not found")
+    return upload
+
+
+def start(db: Session, storage: Storage, user_id: int, key_prefix: str,
+          filename: str, total_size: int, content_type: str) -> models.UploadSession:
+    if total_size <= 0 or total_size > UPLOAD_MAX_SIZE:
+        raise HTTPException(status_code=400, detail=f"Размер файла должен быть от 1 до {UPLOAD_MAX_SIZE} байт.")
+    upload_id = str(uuid.uuid4())
+    key = f"{key_prefix}{upload_id}/{filename}"
+    s3_upload_id = storage.start_multipart(key, content_type)
+    upload = models.UploadSession(
+        id=upload_id, user_id=user_id, filename=filename, content_type=content_type,
+        total_size=total_size, chunk_size=UPLOAD_CHUNK_SIZE, s3_key=key, s3_upload_id=s3_upload_id,
+    )
+    db.add(upload)
+    db.commit()
+    return upload
+
+
+async def read_chunk(request: Request, limit: int = UPLOAD_CHUNK_SIZE) -> bytes:
+    """Body of a chunk upload; refused with 413 as soon as it is known to exceed `limit`."""
+    too_large = HTTPException(status_code=413, detail=f"Chunk must not exceed {limit} bytes")
+    declared = request.headers.get("content-length")
+    if declared is not None and declared.isdigit() and int(declared) > limit:
+        raise too_large
+    body = bytearray()
+    async for part in request.stream():
+        body += part
+        if len(body) > limit:
+            raise too_large
+    return bytes(body)
+
+
+def put_chunk(db: Session, storage: Storage, upload: models.UploadSession, offset: int, data: bytes):
+    if upload.status != "open":
+        raise HTTPException(status_code=409, detail="Upload session is already completed")
+    if offset < 0 or offset >= upload.total_size or offset % upload.chunk_size:
+        raise HTTPException(status_code=400, detail=f"Offset must be a multiple of {upload.chunk_size} below {upload.total_size}")
+    expected_size = min(upload.chunk_size, upload.total_size - offset)
+    if len(data) != expected_size:
+        raise HTTPException(status_code=400, detail=f"Chunk at offset {offset} must be {expected_size} bytes, got {len(data)}")
+
+    part_number = offset // upload.chunk_size + 1
+    key, s3_upload_id = upload.s3_key, upload.s3_upload_id
+    # Return the connection to the pool while the chunk travels to S3.
+    db.rollback()
+    started = time.perf_counter()
+    try:
+        # Re-sending a part replaces it, so clients can retry a chunk blindly.
+        etag = storage.upload_part(key, s3_upload_id, part_number, data)
+    except Exception:
+        metrics.STORAGE_UPLOAD_FAILURES.labels("upload_chunk").inc()
+        raise
+    metrics.observe_upload("upload_chunk", len(data), time.perf_counter() - started)
+
+    db.merge(models.UploadPart(session_id=upload.id, part_number=part_number, size=len(data), etag=etag))
+    upload.updated_at = func.now()
+    db.commit()
+    db.refresh(upload)
+
+
+def complete(db: Session, storage: Storage, upload: models.UploadSession):
+    """Assemble the parts; `upload` must have been loaded with lock=True."""
+    if upload.status in ("completed", "attached"):
+        return
+    if upload.status == "completing" and upload.updated_at > datetime.now() - UPLOAD_COMPLETE_TIMEOUT:
+        raise HTTPException(status_code=409, detail="Upload session is being completed")
+    parts = sorted(upload.parts, key=lambda part: part.part_number)
+    if len(parts) != expected_parts(upload):
+        raise HTTPException(status_code=409, detail="Not all chunks have been received")
+    etags = [(part.part_number, part.etag) for part in parts]
+    key, s3_upload_id = upload.s3_key, upload.s3_upload_id
+    # Claim the session and release the row lock before talking to S3.
+    upload.status = "completing"
+    upload.updated_at = func.now()
+    db.commit()
+    try:
+        storage.complete_multipart(key, s3_upload_id, etags)
+    except Exception:
+        upload.status = "open"
+        db.commit()
+        raise
+    upload.status = "completed"
+    db.commit()
+    db.refresh(upload)
+
+
+def take_completed(db: Session, user_id: int, upload_ids: List[str], attach: bool = True) -> List[models.UploadSession]:
+    """Lock the caller's completed uploads and mark them attached (in the caller's transaction).
+
+    With attach=False the uploads are only looked up, to validate a request
+    before its attachments are taken for real.
+    """
+    if not upload_ids:
+        return []
+    query = db.query(models.UploadSession).filter(
+        models.UploadSession.id.in_(upload_ids),
+        models.UploadSession.user_id == user_id,
+        models.UploadSession.status == "completed",
+    )
+    uploads = (query.with_for_update() if attach else query).all()
+    if len(uploads) != len(set(upload_ids)):
+        raise HTTPException(status_code=400, detail="Загрузка не найдена или еще не завершена.")
+    by_id = {upload.id: upload for upload in uploads}
+    if attach:
+        for upload in uploads:
+            upload.status = "attached"
+    return [by_id[upload_id] for upload_id in dict.fromkeys(upload_ids)]
+
+
+def collect_garbage(db: Session, storage: Storage, older_than: timedelta = UPLOAD_SESSION_TTL) -> int:
+    """Abort idle multipart uploads and delete completed files nobody attached."""
+    cutoff = datetime.now() - older_than
+    stale = db.query(models.UploadSession).filter(models.UploadSession.updated_at < cutoff).all()
+    removed = 0
+    for upload in stale:
+        try:
+            if upload.status == "open":
+                storage.abort_multipart(upload.s3_key, upload.s3_upload_id)
+            elif upload.status == "completing":
+                # The request died around complete_multipart: abort whatever is
+                # left of the upload; an assembled object is left to gc-storage.
+                try:
+                    storage.abort_multipart(upload.s3_key, upload.s3_upload_id)
+                except Exception as e:
+                    logger.info("Upload %s was not pending in storage: %s", upload.id, e)
+            elif upload.status == "completed" and storage.delete_many([upload.s3_key]):
+                continue  # delete_many logged why; retry on the next run
+        except Exception as e:
+            logger.warning("Could not clean up upload %s (%s): %s", upload.id, upload.status, e)
+            continue
+        # Attached uploads only lose their bookkeeping; the object is in use.
+        db.delete(upload)
+        db.commit()
+        removed += 1
+    return removed
@@ -0,0 +1,187 @@
+import csv
+import io
+import json
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Tuple
+
+from fastapi import HTTPException, UploadFile
+from pydantic import ValidationError
+from sqlalchemy import select, text
+from sqlalchemy.orm import Session
+
+from . import models, schemas
+from .auth import get_password_hash
+
+logger = logging.getLogger(__name__)
+
+USER_IMPORT_MAX_ROWS = int(os.environ.get("USER_IMPORT_MAX_ROWS", "50000"))
+USER_IMPORT_MAX_BYTES = int(os.environ.get("USER_IMPORT_MAX_BYTES", str(20 * 1024 * 1024)))
+USER_IMPORT_BATCH_SIZE = int(os.environ.get("USER_IMPORT_BATCH_SIZE", "500"))
+USER_IMPORT_HASH_WORKERS = int(os.environ.get("USER_IMPORT_HASH_WORKERS", str(os.cpu_count() or 1)))
+
+CSV_COLUMNS = ("username", "email", "full_name", "password", "role")
+
+_hash_pool = None
+_hash_pool_lock = threading.Lock()
+
+
+def detect_format(filename: str, content_type: str) -> str:
+    extension = os.path.splitext(filename or "")[1].lower()
+    if extension == ".csv" or "csv" in (content_type or ""):
+        return "csv"
+    if extension in (".ndjson", ".jsonl") or "ndjson" in (content_type or ""):
+        return "ndjson"
+    raise HTTPException(status_code=400, detail="Формат файла не распознан: ожидается CSV или NDJSON.")
+
+
+def read_file(upload: UploadFile, limit: int = USER_IMPORT_MAX_BYTES) -> bytes:
+    """Contents of the uploaded file; refused with 413 before reading when it exceeds `limit`."""
+    too_large = HTTPException(status_code=413, detail=f"Import file must not exceed {limit} bytes")
+    if upload.size is not None and upload.size > limit:
+        raise too_large
+    data = upload.file.read(limit + 1)
+    if len(data) > limit:
+        raise too_large
+    return data
+
+
+def parse_rows(data: bytes, file_format: str) -> Iterator[Tuple[int, object]]:
+    """(row number, dict or error message) for every record; CSV rows are numbered after the header."""
+    try:
+        content = data.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="File must be UTF-8 encoded")
+    if file_format == "csv":
+        reader = csv.DictReader(io.StringIO(content))
+        missing = {"username", "email", "password"} - set(reader.fieldnames or ())
+        if missing:
+            raise HTTPException(status_code=400, detail=f"Missing CSV columns: {', '.join(sorted(missing))}")
+        for number, record in enumerate(reader, start=1):
+            yield number, {key: value for key, value in record.items() if key in CSV_COLUMNS and value != ""}
+        return
+    for number, line in enumerate(content.splitlines(), start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as e:
+            yield number, f"Invalid JSON: {e.msg}"
+            continue
+        yield number, record if isinstance(record, dict) else "Expected a JSON object"
+
+
+def _validation_message(error: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(str(part) for part in item['loc'])}: {item['msg']}" for item in error.errors())
+
+
+def _existing(db: Session, column, values) -> set:
+    found = set()
+    values = list(values)
+    for start in range(0, len(values), USER_IMPORT_BATCH_SIZE):
+        found.update(db.execute(select(column).where(column.in_(values[start:start + USER_IMPORT_BATCH_SIZE]))).scalars())
+    return found
+
+
+def _get_hash_pool() -> ProcessPoolExecutor:
+    # Spawned workers import the app, so they are started once and shared by all imports.
+    global _hash_pool
+    with _hash_pool_lock:
+        if _hash_pool is None:
+            _hash_pool = ProcessPoolExecutor(
+                max_workers=USER_IMPORT_HASH_WORKERS, mp_context=multiprocessing.get_context("spawn")
+            )
+        return _hash_pool
+
+
+def shutdown():
+    """Stop the password-hashing workers (on application shutdown)."""
+    global _hash_pool
+    with _hash_pool_lock:
+        if _hash_pool is not None:
+            _hash_pool.shutdown()
+            _hash_pool = None
+
+
+def _hash_passwords(passwords: List[str]) -> List[str]:
+    # bcrypt is slow by design; worker processes spread it over all cores and
+    # keep it off the API process.
+    workers = min(USER_IMPORT_HASH_WORKERS, len(passwords))
+    if workers <= 1:
+        return [get_password_hash(password) for password in passwords]
+    chunksize = max(1, len(passwords) // (workers * 4))
+    return list(_get_hash_pool().map(get_password_hash, passwords, chunksize=chunksize))
+
+
+def _insert_batch(db: Session, batch: List[Dict]) -> Dict[str, int]:
+    """Multi-row INSERT; rows that hit a unique username or email are skipped. Returns username -> id."""
+    values, params = [], {}
+    for n, row in enumerate(batch):
+        values.append(f"(:username_{n}, :email_{n}, :full_name_{n}, :password_{n}, :role_{n}, TRUE)")
+        params.update({f"{key}_{n}": row[key] for key in ("username", "email", "full_name", "password", "role")})
+    inserted = db.execute(text(f"""
+        INSERT INTO users (username, email, full_name, password, role, is_active)
+        VALUES {", ".join(values)}
+        ON CONFLICT DO NOTHING
+        RETURNING id, username
+    """), params)
+    return {username: user_id for user_id, username in inserted}
+
+
+def import_users(db: Session, data: bytes, file_format: str) -> dict:
+    """Validate, hash and insert the users in `data`; every rejected row is reported, the rest are created."""
+    errors: List[dict] = []
+    valid: List[Tuple[int, schemas.UserImportRow]] = []
+    seen_usernames, seen_emails = set(), set()
+    for number, record in parse_rows(data, file_format):
+        if number > USER_IMPORT_MAX_ROWS:
+            raise HTTPException(status_code=413, detail=f"No more than {USER_IMPORT_MAX_ROWS} rows per import")
+        if isinstance(record, str):
+            errors.append({"row": number, "error": record})
+            continue
+        try:
+            row = schemas.UserImportRow(**record)
+        except ValidationError as e:
+            errors.append({"row": number, "username": record.get("username"), "error": _validation_message(e)})
+            continue
+        if row.username in seen_usernames or row.email in seen_emails:
+            errors.append({"row": number, "username": row.username, "error": "Duplicate username or email in file"})
+            continue
+        seen_usernames.add(row.username)
+        seen_emails.add(row.email)
+        valid.append((number, row))
+
+    # Skip known accounts before hashing; ON CONFLICT still covers concurrent sign-ups.
+    taken_usernames = _existing(db, models.User.username, seen_usernames)
+    taken_emails = _existing(db, models.User.email, seen_emails)
+    db.rollback()
+    pending_rows = []
+    for number, row in valid:
+        if row.username in taken_usernames or row.email in taken_emails:
+            errors.append({"row": number, "username": row.username, "error": "Username or email already registered"})
+        else:
+            pending_rows.append((number, row))
+
+    hashes = _hash_passwords([row.password for _, row in pending_rows])
+    created = []
+    for start in range(0, len(pending_rows), USER_IMPORT_BATCH_SIZE):
+        chunk = pending_rows[start:start + USER_IMPORT_BATCH_SIZE]
+        batch = [
+            {"username": row.username, "email": row.email, "full_name": row.full_name,
+             "password": password_hash, "role": row.role}
+            for (_, row), password_hash in zip(chunk, hashes[start:start + USER_IMPORT_BATCH_SIZE])
+        ]
+        inserted = _insert_batch(db, batch)
+        db.commit()
+        for number, row in chunk:
+            if row.username in inserted:
+                created.append({"row": number, "id": inserted[row.username], "username": row.username})
+            else:
+                errors.append({"row": number, "username": row.username, "error": "Username or email already registered"})
+        logger.info("Imported %d of %d users", len(created), len(pending_rows))
+
+    errors.sort(key=lambda error: error["row"])
+    return {"created": created, "errors": errors}
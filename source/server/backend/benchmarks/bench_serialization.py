@@ -0,0 +1,97 @@
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from datetime import datetime, timedelta
+from typing import List
+
+from fastapi.responses import JSONResponse, ORJSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from app import models, schemas, serializers
+
+
+def build_chat(size: int) -> List[models.Message]:
+    citizen = models.User(
+        id=1, username="citizen", email="citizen@example.com", full_name="Иван Петров",
+        role="citizen", is_active=True, created_at=datetime(2024, 1, 1, 9, 0, 0),
+    )
+    inspector = models.User(
+        id=2, username="inspector", email="inspector@example.com", full_name="Инспектор",
+        role="inspector", is_active=True, created_at=datetime(2024, 1, 1, 9, 0, 0),
+    )
+    started = datetime(2024, 3, 1, 12, 0, 0)
+    messages = []
+    for i in range(size):
+        sender = citizen if i % 2 == 0 else inspector
+        file_paths = None
+        if i % 10 == 0:
+            file_paths = json.dumps([f"https://storage.yandexcloud.net/bucket/citizen/1_addr/chat/{i}/plan.pdf"])
+        messages.append(models.Message(
+            id=i + 1,
+            appeal_id=1,
+            sender_id=sender.id,
+            sender=sender,
+            content=f"Сообщение номер {i} по обращению о перепланировке",
+            created_at=started + timedelta(seconds=i),
+            file_paths=file_paths,
+        ))
+    return messages
+
+
+def legacy_path(messages: List[models.Message], field) -> bytes:
+    response_list = []
+    for msg_orm in messages:
+        decoded_paths_list = None
+        if msg_orm.file_paths:
+            decoded_paths_list = [str(item) for item in json.loads(msg_orm.file_paths)]
+        response_list.append(schemas.Message(
+            id=msg_orm.id,
+            appeal_id=msg_orm.appeal_id,
+            sender_id=msg_orm.sender_id,
+            content=msg_orm.content,
+            created_at=msg_orm.created_at,
+            sender=msg_orm.sender,
+            file_paths=decoded_paths_list,
+        ))
+    content = asyncio.run(serialize_response(field=field, response_content=response_list))
+    return JSONResponse(content).body
+
+
+def fast_path(messages: List[models.Message]) -> bytes:
+    return ORJSONResponse(serializers.messages_to_list(messages)).body
+
+
+def measure(func, repeat: int) -> List[float]:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serialization benchmark for read_messages")
+    parser.add_argument("--messages", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    messages = build_chat(args.messages)
+    field = create_response_field(name="Response_read_messages", type_=List[schemas.Message])
+
+    assert json.loads(legacy_path(messages, field)) == json.loads(fast_path(messages))
+
+    results = {
+        "legacy (schemas.Message + json)": measure(lambda: legacy_path(messages, field), args.repeat),
+        "fast (serializers + orjson)": measure(lambda: fast_path(messages), args.repeat),
+    }
+    print(f"Chat size: {args.messages} messages, {args.repeat} runs")
+    for name, timings in results.items():
+        print(f"{name:34} median {statistics.median(timings):8.2f} ms   min {min(timings):8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+"""Micro-benchmarks for the backend's hot paths.
+
+    python -m benchmarks.run                          # every suite that can run here
+    python -m benchmarks.run --suite tokens --suite serialization
+    python -m benchmarks.run --compare benchmarks/results/baseline.json
+
+The "db" suite needs DATABASE_URL pointing at a database filled by
+benchmarks.seed. Results are written as sorted JSON (benchmarks/results/latest.json
+by default); commit a baseline next to a change and --compare flags every
+benchmark whose median got slower than --threshold.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable, Dict, List
+
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+
+os.environ.setdefault("SECRET_KEY", "benchmark-secret")
+os.environ.setdefault("ALGORITHM", "HS256")
+os.environ.setdefault("ACCESS_TOKEN_EXPIRE_MINUTES", "30")
+
+from app import auth, models, schemas, serializers  # noqa: E402
+from benchmarks.bench_serialization import build_chat  # noqa: E402
+
+SORT_FIELDS = ("created_at", "address", "status_id", "category_id")
+SORT_ORDERS = ("asc", "desc")
+CHAT_SIZES = (10, 100, 1000)
+
+
+def measure(func: Callable[[], object], repeat: int, warmup: int) -> Dict[str, float]:
+    for _ in range(warmup):
+        func()
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return {
+        "min_ms": round(timings[0], 4),
+        "median_ms": round(statistics.median(timings), 4),
+        "p95_ms": round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 4),
+        "runs": repeat,
+    }
+
+
+def build_appeals(size: int) -> List[models.Appeal]:
+    owner = build_chat(1)[0].sender
+    status = models.AppealStatus(id=1, name="Новое")
+    category = models.AppealCategory(id=1, name="Перепланировка")
+    started = datetime(2024, 3, 1, 12, 0, 0)
+    return [
+        models.Appeal(
+            id=i + 1, user_id=owner.id, user=owner, status_id=status.id, status=status,
+            category_id=category.id, category=category,
+            address=f"ул. Ленина, д. {i % 200 + 1}, кв. {i % 300 + 1}",
+            description="Прошу согласовать перепланировку квартиры",
+            created_at=started + timedelta(minutes=i), updated_at=started + timedelta(minutes=i + 5),
+            file_paths=json.dumps([f"https://storage.yandexcloud.net/bucket/1/{i}/plan.pdf"]),
+        )
+        for i in range(size)
+    ]
+
+
+def suite_tokens(bench):
+    claims = {"sub": "citizen", "role": "citizen", "user_id": 1}
+    token = auth.create_access_token(claims)
+    bench("tokens.create_access_token", lambda: auth.create_access_token(claims))
+    bench("tokens.decode_token", lambda: auth.decode_token(token))
+
+
+def suite_serialization(bench):
+    for size in CHAT_SIZES:
+        messages = build_chat(size)
+        bench(f"serialization.schemas_message[{size}]", lambda: [
+            schemas.Message.model_validate(serializers.message_to_dict(message)).model_dump_json()
+            for message in messages
+        ])
+        bench(f"serialization.messages_to_list[{size}]", lambda: serializers.messages_to_list(messages))
+    appeals = build_appeals(100)
+    bench("serialization.schemas_appeal[100]", lambda: [
+        schemas.Appeal.model_validate(serializers.appeal_to_dict(appeal)).model_dump_json()
+        for appeal in appeals
+    ])
+    bench("serialization.appeals_to_list[100]", lambda: serializers.appeals_to_list(appeals))
+
+
+def suite_db(bench):
+    from sqlalchemy import func
+
+    from app import main
+    from app.database import SessionLocal, get_engine
+
+    get_engine()
+    db = SessionLocal()
+    try:
+        inspector = db.query(models.User).filter(models.User.role == "inspector").order_by(models.User.id).first()
+        # The busiest citizen is the worst case for the citizen-scoped listing.
+        busiest = (
+            db.query(models.Appeal.user_id)
+            .group_by(models.Appeal.user_id)
+            .order_by(func.count().desc())
+            .limit(1)
+            .scalar()
+        )
+        citizen = db.get(models.User, busiest) if busiest else None
+        if inspector is None or citizen is None:
+            print("db suite: no data, run python -m benchmarks.seed first", file=sys.stderr)
+            return
+        status_id = db.query(models.AppealStatus.id).order_by(models.AppealStatus.id).limit(1).scalar()
+        category_id = db.query(models.AppealCategory.id).order_by(models.AppealCategory.id).limit(1).scalar()
+
+        token = auth.create_access_token({"sub": citizen.username, "role": citizen.role, "user_id": citizen.id})
+        bench("db.get_current_user", lambda: asyncio.run(main.get_current_user(db=db, token=token)))
+
+        filters = {
+            "all": {},
+            "status": {"status_id": status_id},
+            "category": {"category_id": category_id},
+            "status+category": {"status_id": status_id, "category_id": category_id},
+        }
+        for user, (sort_by, sort_order), (filter_name, filter_args) in itertools.product(
+            (inspector, citizen), itertools.product(SORT_FIELDS, SORT_ORDERS), filters.items()
+        ):
+            kwargs = dict(
+                skip=0, limit=100, sort_by=sort_by, sort_order=sort_order,
+                status_id=None, category_id=None, assignee_id=None,
+                fields=None, include=None, archived=False, db=db, current_user=user,
+            )
+            kwargs.update(filter_args)
+            bench(f"db.read_appeals[{user.role},{sort_by},{sort_order},{filter_name}]",
+                  lambda kwargs=kwargs: main.read_appeals(**kwargs))
+
+        chat_sizes = (
+            db.query(models.Message.appeal_id, func.count().label("size"))
+            .group_by(models.Message.appeal_id)
+            .subquery()
+        )
+        for size in CHAT_SIZES:
+            appeal_id = (
+                db.query(chat_sizes.c.appeal_id)
+                .filter(chat_sizes.c.size >= size)
+                .order_by(chat_sizes.c.size)
+                .limit(1)
+                .scalar()
+            )
+            if appeal_id is None:
+                continue
+            for limit in sorted({100, size}):
+                bench(f"db.read_messages[{size},limit={limit}]", lambda appeal_id=appeal_id, limit=limit: main.read_messages(
+                    appeal_id=appeal_id, skip=0, limit=limit, last_message_id=None, latest=False, before_id=None,
+                    db=db, current_user=inspector,
+                ))
+            bench(f"db.read_messages[{size},latest]", lambda appeal_id=appeal_id: main.read_messages(
+                appeal_id=appeal_id, skip=0, limit=100, last_message_id=None, latest=True, before_id=None,
+                db=db, current_user=inspector,
+            ))
+            db.expire_all()
+    finally:
+        db.close()
+
+
+SUITES = {
+    "tokens": suite_tokens,
+    "serialization": suite_serialization,
+    "db": suite_db,
+}
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(results: Dict[str, dict], baseline_path: Path, threshold: float) -> int:
+    baseline = json.loads(baseline_path.read_text())["results"]
+    regressions = 0
+    for name, result in sorted(results.items()):
+        before = baseline.get(name)
+        if before is None:
+            continue
+        change = result["median_ms"] / before["median_ms"] - 1 if before["median_ms"] else 0.0
+        marker = ""
+        if change > threshold:
+            marker = "  REGRESSION"
+            regressions += 1
+        print(f"{name:60} {before['median_ms']:10.3f} -> {result['median_ms']:10.3f} ms  {change:+7.1%}{marker}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run backend micro-benchmarks")
+    parser.add_argument("--suite", action="append", choices=sorted(SUITES), help="default: all that can run")
+    parser.add_argument("--repeat", type=int, default=30)
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--output", type=Path, default=RESULTS_DIR / "latest.json")
+    parser.add_argument("--compare", type=Path, help="baseline results file")
+    parser.add_argument("--threshold", type=float, default=0.15, help="allowed median slowdown, 0.15 = 15%%")
+    args = parser.parse_args()
+
+    suites = args.suite or [name for name in SUITES if name != "db" or os.environ.get("DATABASE_URL")]
+    results: Dict[str, dict] = {}
+
+    def bench(name, func):
+        results[name] = measure(func, args.repeat, args.warmup)
+        print(f"{name:60} median {results[name]['median_ms']:10.3f} ms   p95 {results[name]['p95_ms']:10.3f} ms")
+
+    for name in suites:
+        SUITES[name](bench)
+
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    report = {
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "suites": suites,
+        "results": results,
+    }
+    args.output.write_text(json.dumps(report, indent=2, sort_keys=True, ensure_ascii=False) + "\n")
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        regressions = compare(results, args.compare, args.threshold)
+        if regressions:
+            print(f"{regressions} benchmark(s) slower than the baseline by more than {args.threshold:.0%}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
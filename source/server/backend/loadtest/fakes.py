@@ -0,0 +1,64 @@
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+
+class InMemoryS3:
+    """Enough of the boto3 S3 client surface for the backend, kept in a dict."""
+
+    def __init__(self, upload_latency: float = 0.0):
+        self.upload_latency = upload_latency
+        self.objects = {}
+        self._lock = threading.Lock()
+
+    def upload_fileobj(self, Fileobj, Bucket, Key, ExtraArgs=None, **kwargs):
+        data = Fileobj.read()
+        if self.upload_latency:
+            time.sleep(self.upload_latency)
+        with self._lock:
+            self.objects[(Bucket, Key)] = (data, datetime.now(timezone.utc))
+
+    def put_object(self, Bucket, Key, Body=b"", **kwargs):
+        data = Body if isinstance(Body, bytes) else Body.read()
+        with self._lock:
+            self.objects[(Bucket, Key)] = (data, datetime.now(timezone.utc))
+        return {"ETag": f'"{uuid.uuid4().hex}"'}
+
+    def head_object(self, Bucket, Key, **kwargs):
+        data, modified = self.objects[(Bucket, Key)]
+        return {"ContentLength": len(data), "LastModified": modified}
+
+    def list_objects_v2(self, Bucket, Prefix="", **kwargs):
+        with self._lock:
+            keys = sorted(key for bucket, key in self.objects if bucket == Bucket and key.startswith(Prefix))
+        contents = [
+            {"Key": key, "Size": len(self.objects[(Bucket, key)][0]), "LastModified": self.objects[(Bucket, key)][1]}
+            for key in keys
+        ]
+        return {"Contents": contents, "KeyCount": len(contents), "IsTruncated": False}
+
+    def delete_objects(self, Bucket, Delete, **kwargs):
+        with self._lock:
+            for item in Delete["Objects"]:
+                self.objects.pop((Bucket, item["Key"]), None)
+        return {"Deleted": Delete["Objects"]}
+
+
+def install_fakes(upload_latency: float = 0.0, fcm_latency: float = 0.0):
+    """Replace object storage and FCM delivery with in-process stand-ins."""
+    from firebase_admin import messaging
+
+    from app import notifications, storage
+
+    s3 = InMemoryS3(upload_latency)
+    storage._s3_client = s3
+
+    def fake_send(message, dry_run=False, app=None):
+        if fcm_latency:
+            time.sleep(fcm_latency)
+        return f"projects/loadtest/messages/{uuid.uuid4().hex}"
+
+    messaging.send = fake_send
+    notifications._firebase_ready = True
+    return s3